@@ -12,26 +12,70 @@
 # Code is simple and selfexplanatory.
 
 import cv2
+import numpy as np
+import macros as M
 
 
-def CheckBrightness(Image):
-	Height, Width = Image.shape[:2]
-	Sum = 0
-	UpperLimitOfValue = 0
+################################################################################
+# Function      : FindMeanBrightness
+# Parameter     : Image - Image of OMR sheet(BGR or already grayscale).
+#                 SampleStep - Only every SampleStep'th row and column is read.
+#                              1 reads every pixel.
+# Description   : This function finds the mean gray value of the image. The
+#                 image is subsampled before the gray conversion so that only
+#                 the pixels which are read are converted.
+# Return        : Mean brightness of the image.
+################################################################################
+def FindMeanBrightness(Image, SampleStep=1):
+	SampledImage = Image[::SampleStep, ::SampleStep]
 
-	GrayImage = cv2.cvtColor(Image, cv2.COLOR_BGR2GRAY)
+	if len(SampledImage.shape) == 3:
+		GrayImage = cv2.cvtColor(SampledImage, cv2.COLOR_BGR2GRAY)
+	else:
+		GrayImage = SampledImage
 
-	for i in range(Height):
-		for j in range(Width):
-			Sum += GrayImage[i][j]
+	# Summing in int64 keeps the result exact(same as summing pixel by pixel).
+	return int(GrayImage.sum(dtype=np.int64)) / GrayImage.size
 
-	Sum /= (Height*Width)
 
-	if Sum >= 200:
+################################################################################
+# Function      : UpperLimitFromBrightness
+# Parameter     : Mean - Mean brightness of the image(s).
+# Description   : This function maps the mean brightness to the upper limit of
+#                 "Value" used for masking.
+# Return        : UpperLimitOfValue
+################################################################################
+def UpperLimitFromBrightness(Mean):
+	if Mean >= 200:
 		UpperLimitOfValue = 150
-	elif Sum >= 175:
+	elif Mean >= 175:
 		UpperLimitOfValue = 130  
 	else:
 		UpperLimitOfValue = 100
 
-	return UpperLimitOfValue
\ No newline at end of file
+	return UpperLimitOfValue
+
+
+def CheckBrightness(Image, SampleStep=None):
+	if SampleStep is None:
+		SampleStep = M.BRIGHTNESS_SAMPLE_STEP
+
+	return UpperLimitFromBrightness(FindMeanBrightness(Image, SampleStep))
+
+
+################################################################################
+# Function      : CalibrateBrightness
+# Parameter     : Images - List of few images of OMR sheets of the same scanner
+#                          batch.
+# Description   : This function finds the upper limit of "Value" once for a
+#                 batch from the average brightness of the images provided, so
+#                 that it need not be checked again for every sheet.
+# Return        : UpperLimitOfValue
+################################################################################
+def CalibrateBrightness(Images, SampleStep=None):
+	if SampleStep is None:
+		SampleStep = M.BRIGHTNESS_SAMPLE_STEP
+
+	Mean = sum(FindMeanBrightness(Image, SampleStep) for Image in Images) / len(Images)
+
+	return UpperLimitFromBrightness(Mean)
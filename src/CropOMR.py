@@ -11,7 +11,27 @@
 import cv2
 import numpy as np
 import macros as M
-from FindBoundingBoxes import FindBoundingBoxes
+from FindBoundingBoxes import FindBoundingBoxes, TrackCornerBoxes
+from CheckBrightness import CheckBrightness
+
+
+################################################################################
+# Class         : CropState
+# Parameter     : PrevInitialCorners - Stores the InitialCorners value of the 
+#                                      previous iteration.
+#                 PrevKey - Key pressed in the previous iteration.
+#                 PrevCornerBoxes - The 4 corner guiding boxes of the previous
+#                                   sheet.(Used if M.REUSE_PREVIOUS_GUIDING_BOXES)
+# Description   : Holds the values kept from one iteration(or sheet) to the
+#                 next while cropping, in place of module globals so that
+#                 different sheets can be cropped at the same time.
+# Return        : -
+################################################################################
+class CropState:
+    def __init__(self):
+        self.PrevInitialCorners = None
+        self.PrevKey = None
+        self.PrevCornerBoxes = None
 
 
 ################################################################################
@@ -27,16 +47,15 @@ from FindBoundingBoxes import FindBoundingBoxes
 #                           corners in the same order as that of InitialCorners.
 #                 Coordinates - It holds the value of initial coordinates in a 
 #                               from of list for better readability.
-#                 PrevInitialCorners - Stores the InitialCorners variable value 
-#                                   of the previous iteration as a global value.
+#                 State - CropState which stores the InitialCorners value of
+#                         the previous iteration(PrevInitialCorners).
 #                 AskNextAction - Flag denoting that the user sholud be asked 
 #                                 next action of expanding edge or not.
 # Description   : This sets the Initial and Final coordinates of the guiding
 #                 corner boxes.
 # Return        : InitialCorners, FinalCorners
 ################################################################################
-def SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, RightGuidingBoxes, Size, ExpandSideBy):
-    global PrevInitialCorners
+def SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, RightGuidingBoxes, Size, ExpandSideBy, State):
     AskNextAction = True
     # Setting the value of Coordinates to beautify the code.
     Coordinates = []
@@ -56,10 +75,10 @@ def SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, RightGuidingBoxes, Size
                                      [Coordinates[2], Coordinates[3]],
                                      [Coordinates[4], Coordinates[5]],
                                      [Coordinates[6], Coordinates[7]]])
-        PrevInitialCorners = InitialCorners
+        State.PrevInitialCorners = InitialCorners
     else:
       print("\n\nCannot expand side more than this, if the output is still wrong, Input different image\n\n")
-      InitialCorners = PrevInitialCorners
+      InitialCorners = State.PrevInitialCorners
       AskNextAction = False
 
 
@@ -72,6 +91,35 @@ def SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, RightGuidingBoxes, Size
     return InitialCorners, FinalCorners, AskNextAction
 
 
+################################################################################
+# Function      : FindProjectiveMatrix
+# Parameter     : InitialCorners - It contains the initial coordinates of 4 corners
+#                                  in clockwise order starting from top left.
+#                 FinalCorners - It contains the final coordinates of 4 corners
+#                                in clockwise order starting from top left.
+#                 InputSize - Size(width, height) of input image.
+#                 OutputSize - Size(width, height) of output image. If passed, 
+#                              the resize from InputSize to it is folded in the 
+#                              projective matrix.
+#                 ScaleMatrix - Matrix resizing the image(pixel centers are
+#                               mapped as done by cv2.resize).
+# Description   : This function finds the matrix of projective transform from
+#                 input image to the cropped OMR Sheet.
+# Return        : ProjectiveMatrix
+################################################################################
+def FindProjectiveMatrix(InitialCorners, FinalCorners, InputSize, OutputSize=None):
+    ProjectiveMatrix = cv2.getPerspectiveTransform(InitialCorners, FinalCorners)
+
+    if OutputSize is not None and tuple(OutputSize) != tuple(InputSize):
+        Scale_X, Scale_Y = OutputSize[0] / InputSize[0], OutputSize[1] / InputSize[1]
+        ScaleMatrix = np.array([[Scale_X, 0., 0.5*Scale_X - 0.5],
+                                [0., Scale_Y, 0.5*Scale_Y - 0.5],
+                                [0., 0., 1.]])
+        ProjectiveMatrix = ScaleMatrix @ ProjectiveMatrix
+
+    return ProjectiveMatrix
+
+
 ################################################################################
 # Function      : ProjectiveTransform
 # Parameter     : OutputImage - It is the image of cropped and projective 
@@ -80,19 +128,89 @@ def SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, RightGuidingBoxes, Size
 #                                  in clockwise order starting from top left.
 #                 FinalCorners - It contains the final coordinates of 4 corners
 #                                in clockwise order starting from top left.
+#                 OutputSize - Size(width, height) of OutputImage. If passed, 
+#                              the resize from size of input image to it is 
+#                              folded in the projective matrix so that the
+#                              image is warped only once.
 # Description   : This function applies projective transform on cropped OMR Sheet.
 # Return        : OutputImage
 ################################################################################
-def ProjectiveTransform(InputImage, InitialCorners, FinalCorners):
+def ProjectiveTransform(InputImage, InitialCorners, FinalCorners, OutputSize=None):
     Rows, Cols = InputImage.shape[:2]
+    if OutputSize is None:
+        OutputSize = (Cols, Rows)
     
     # Applying projective transform
-    ProjectiveMatrix = cv2.getPerspectiveTransform(InitialCorners, FinalCorners)
-    OutputImage = cv2.warpPerspective(InputImage, ProjectiveMatrix, (Cols, Rows))
+    ProjectiveMatrix = FindProjectiveMatrix(InitialCorners, FinalCorners, (Cols, Rows), OutputSize)
+    OutputImage = cv2.warpPerspective(InputImage, ProjectiveMatrix, tuple(OutputSize))
 
     return OutputImage
 
 
+################################################################################
+# Function      : FindGuidingBoxesOfSheet
+# Parameter     : InputImage - It is the image of OMR Sheet.
+#                 UpperLimitOfValue - Upper limit of "Value" for masking if it is
+#                                     already known(calibrated for the batch).
+#                 State - CropState of the sheets being cropped.
+#                 ValueImage - "Value" plane of the input image(if found).
+#                 CornerBoxes - Corner guiding boxes found again near their
+#                               position in the previous sheet.
+# Description   : This function finds the left and right guiding boxes of the
+#                 sheet. If asked, corner guiding boxes of the previous sheet
+#                 in State are searched again near their position first and
+#                 the guiding boxes are found in complete image only if they
+#                 are not found.
+# Return        : LeftGuidingBoxes, RightGuidingBoxes
+################################################################################
+def FindGuidingBoxesOfSheet(InputImage, UpperLimitOfValue, State, ValueImage=None):
+    # Guiding boxes are found in "Value" plane if it is passed. Brightness is still 
+    # checked in the input image.
+    if ValueImage is not None:
+        if UpperLimitOfValue is None:
+            UpperLimitOfValue = CheckBrightness(InputImage)
+        InputImage = ValueImage
+
+    CornerBoxes = None
+    if M.REUSE_PREVIOUS_GUIDING_BOXES == 1 and State.PrevCornerBoxes is not None:
+        CornerBoxes = TrackCornerBoxes(InputImage, State.PrevCornerBoxes, UpperLimitOfValue)
+
+    if CornerBoxes is not None:
+        # Only first and last guiding boxes of each side are used for cropping.
+        LeftGuidingBoxes = [CornerBoxes[0], CornerBoxes[3]]
+        RightGuidingBoxes = [CornerBoxes[1], CornerBoxes[2]]
+    else:
+        LeftGuidingBoxes, RightGuidingBoxes = FindBoundingBoxes(InputImage, UpperLimitOfValue)
+    State.PrevCornerBoxes = [LeftGuidingBoxes[0], RightGuidingBoxes[0], RightGuidingBoxes[-1], 
+                             LeftGuidingBoxes[-1]]
+
+    return LeftGuidingBoxes, RightGuidingBoxes
+
+
+################################################################################
+# Function      : FindCropMatrix
+# Parameter     : InputImage - It is the image of OMR Sheet.
+#                 {Rest parameters are same as that of CropOMR}
+# Description   : This function finds the matrix of projective transform from
+#                 input image to the cropped OMR Sheet of M.RESIZE_TO size
+#                 without warping the image, so that only the parts of sheet
+#                 needed can be sampled.
+# Return        : ProjectiveMatrix
+################################################################################
+def FindCropMatrix(InputImage, ExpandSideBy=[0, 0], UpperLimitOfValue=None, State=None, ValueImage=None):
+    if State is None:
+        State = CropState()
+
+    LeftGuidingBoxes, RightGuidingBoxes = FindGuidingBoxesOfSheet(InputImage, UpperLimitOfValue, State, 
+                                                                  ValueImage)
+
+    InputSize = (InputImage.shape[1], InputImage.shape[0])
+    InitialCorners, FinalCorners, AskNextAction = SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, 
+            RightGuidingBoxes, InputSize, list(ExpandSideBy), State)
+
+    return FindProjectiveMatrix(InitialCorners, FinalCorners, InputSize, M.RESIZE_TO)
+
+
 ################################################################################
 # Function      : CropOMR
 # Parameter     : InputImage - It is the image of OMR Sheet.
@@ -104,15 +222,35 @@ def ProjectiveTransform(InputImage, InitialCorners, FinalCorners):
 #                                expand the top and bottom side respectively.
 #                 AskNextAction - Flag denoting that the user sholud be asked 
 #                                 next action of expanding edge or not.
+#                 UpperLimitOfValue - Upper limit of "Value" for masking if it is
+#                                     already known(calibrated for the batch).
+#                 State - CropState kept between iterations. A new one is made
+#                         if not passed.
+#                 GrayOnly - Flag for warping only the gray plane of the input
+#                            image. CroppedOMR is then a gray image.
+#                 ValueImage - "Value" plane of the input image if it is already
+#                              found. Guiding boxes are then found in it and
+#                              InputImage can be the gray image.
 #                 {Other parameters are self explanatory.}
 # Description   : This function calls suitable functions one by one for
 #                 detecting corner guiding boxes, and transforming the OMR
 #                 sheet.
 # Return        : CroppedOMR, ExpandSideBy
 ################################################################################
-def CropOMR(InputImage, SetExpandSideByValue=0, ExpandSideBy=[0, 0]):
-    global PrevKey
-    LeftGuidingBoxes, RightGuidingBoxes = FindBoundingBoxes(InputImage)
+def CropOMR(InputImage, SetExpandSideByValue=0, ExpandSideBy=[0, 0], UpperLimitOfValue=None, State=None,
+            GrayOnly=False, ValueImage=None):
+    if State is None:
+        State = CropState()
+    # Copying so that the default(or caller's) list is not changed while setting the value.
+    ExpandSideBy = list(ExpandSideBy)
+
+    LeftGuidingBoxes, RightGuidingBoxes = FindGuidingBoxesOfSheet(InputImage, UpperLimitOfValue, State, 
+                                                                  ValueImage)
+
+    if GrayOnly and len(InputImage.shape) == 3:
+        ImageToWarp = cv2.cvtColor(InputImage, cv2.COLOR_BGR2GRAY)
+    else:
+        ImageToWarp = InputImage
 
     # Using infinite loop to set ExpandSideBy value or it will break in the first iteration 
     # only if we donot wish to set the value.
@@ -120,11 +258,14 @@ def CropOMR(InputImage, SetExpandSideByValue=0, ExpandSideBy=[0, 0]):
         #print("Expand Side by - {}".format(ExpandSideBy))
         # Setting Initial and Final corners values.
         InitialCorners, FinalCorners, AskNextAction = SetCoordinatesOfCornerGuidingBoxes(LeftGuidingBoxes, 
-                RightGuidingBoxes, (InputImage.shape[1], InputImage.shape[0]), ExpandSideBy)
+                RightGuidingBoxes, (InputImage.shape[1], InputImage.shape[0]), ExpandSideBy, State)
         
         # Applying Projective transformation.
-        CroppedOMR = ProjectiveTransform(InputImage, InitialCorners, FinalCorners)
-        CroppedOMR = cv2.resize(CroppedOMR, M.RESIZE_TO)
+        if M.CROP_WARP_TO_OUTPUT_SIZE == 1:
+            CroppedOMR = ProjectiveTransform(ImageToWarp, InitialCorners, FinalCorners, M.RESIZE_TO)
+        else:
+            CroppedOMR = ProjectiveTransform(ImageToWarp, InitialCorners, FinalCorners)
+            CroppedOMR = cv2.resize(CroppedOMR, M.RESIZE_TO)
         #cv2.imshow("CroppedOMR", CroppedOMR)
 
         # Ask for setting the value of ExpandSideBy if prompted.
@@ -147,7 +288,7 @@ def CropOMR(InputImage, SetExpandSideByValue=0, ExpandSideBy=[0, 0]):
                     ExpandSideBy[1] -= 10'''
             break
 
-        PrevKey = Key
+        State.PrevKey = Key
 
     #print("Expand Side by - {}".format(ExpandSideBy))
 
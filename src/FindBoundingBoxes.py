@@ -10,30 +10,71 @@
 import numpy as np
 import cv2
 import os
+import threading
 import macros as M
 import CheckBrightness as CB
 
 
+# Gray template images of all sizes, loaded once per process for each template
+# images' folder. (Filled by LoadTemplateImages)
+TemplateImagesCache = {}
+TemplateImagesCacheLock = threading.Lock()
+
+
+################################################################################
+# Class         : DetectionContext
+# Parameter     : Image - Input image of OMR sheet.
+#                 UpperLimitOfValue - Upper limit of "Value" used for masking.
+#                 MaskedImage - Masked image(set when it is made).
+# Description   : Holds everything about the sheet whose guiding boxes are
+#                 being found, so that different sheets can be processed at
+#                 the same time(in different threads).
+# Return        : -
+################################################################################
+class DetectionContext:
+    def __init__(self, Image, UpperLimitOfValue):
+        self.Image = Image
+        self.UpperLimitOfValue = UpperLimitOfValue
+        self.MaskedImage = None
+
+
+################################################################################
+# Function      : FindValuePlane
+# Parameter     : Image - BGR image.
+# Description   : This function finds the "Value" plane of HSV of the image
+#                 without converting it to HSV, as "Value" is simply the max of
+#                 B, G and R.
+# Return        : ValueImage
+################################################################################
+def FindValuePlane(Image):
+    return cv2.max(cv2.max(Image[:, :, 0], Image[:, :, 1]), Image[:, :, 2])
+
+
 ################################################################################
 # Function      : MaskImage
-# Parameter     : HSVImage - It contains HSV of input OMR image.
-#                 LowerRange, UpperRange - They mention the range used to extract
-#                                   horizontal block near the edges(Black colour).
+# Parameter     : Context - DetectionContext of the sheet.
+#                 Image - Part of the input image to be masked.(Complete
+#                         input image if not passed). It can be BGR or its
+#                         "Value" plane(single channel).
+#                 ValueImage - It contains "Value" of input OMR image.
 #                 MaskedImage - It contains the Masked Image.
 #                 MaskedBlurImage - Blur of Masked Image.
 # Description   : This function masks the input OMR image for black to a range 
-#                 of dark gray colour.
+#                 of dark gray colour. Hue and saturation can be anything, so 
+#                 only "Value" is checked.
 # Return        : MaskedBlurImage
 ################################################################################
-def MaskImage(UpperLimitOfValue):
-    HSVImage = cv2.cvtColor(Image, cv2.COLOR_BGR2HSV)
+def MaskImage(Context, Image=None):
+    if Image is None:
+        Image = Context.Image
 
-    # Setting range
-    LowerRange = np.array([0, 0, 0])
-    UpperRange = np.array([255, 255, UpperLimitOfValue])
+    if len(Image.shape) == 3:
+        ValueImage = FindValuePlane(Image)
+    else:
+        ValueImage = Image
 
     # Masking
-    MaskedImage = cv2.inRange(HSVImage, LowerRange, UpperRange)
+    MaskedImage = cv2.inRange(ValueImage, 0, Context.UpperLimitOfValue)
     
     # Blurring
     MaskedBlurImage = cv2.GaussianBlur(MaskedImage, (3, 3), 0)
@@ -109,34 +150,56 @@ def IntersectingArea(Rect1, Rect2):
 #                                  corner and bottom right corner of the
 #                                  boxes as a list of list.
 #                 LengthOfBoxCoordinates - Stores the length of BoxCoordinates.
+#                 CellSize - Size of the square cells of the grid in which
+#                            boxes are bucketed.(Median size of the boxes)
+#                 Grid - Stores the index of the boxes already checked in
+#                        each cell which the box covers.
 #                 FoundIntersectingArea - Flag of whether Intersecting area is
 #                                         found or not.
 #                 Rect1, Rect2 - Stores 2 rectangles to be compared.
 #                 FinalBoxCoordinates - Final list of boxes which donot
 #                                       have any intersecting boxes.
-# Description   : This function finds the intersecting area of 2 boxes
-#                 from the list BoxCoordinates and if no intersecting box
-#                 is found, it stores the box in FinalBoxCoordinates.
+# Description   : This function keeps a box from the list BoxCoordinates only
+#                 if it does not intersect any box which comes after it.
+#                 Boxes are checked from the last and bucketed in a grid, so
+#                 a box is compared only with the later boxes sharing a cell
+#                 with it and not with all of them.
 # Return        : FinalBoxCoordinates
 ################################################################################
 def FilterBoxCoordinates(BoxCoordinates):
-    FinalBoxCoordinates = []
-
     LengthOfBoxCoordinates = len(BoxCoordinates)
+    if LengthOfBoxCoordinates == 0:
+        return []
 
-    for I in range(LengthOfBoxCoordinates):
-        FoundIntersectingArea = 0
-        Rect1 = BoxCoordinates[I].copy()
-
-        for J in range(I + 1, LengthOfBoxCoordinates):
-            Rect2 = BoxCoordinates[J].copy()
+    Boxes = np.asarray(BoxCoordinates).reshape(-1, 4)
+    CellSize = max(int(np.median(np.maximum(Boxes[:, 2] - Boxes[:, 0], 
+                                            Boxes[:, 3] - Boxes[:, 1]))) + 1, 1)
+    Cells = (Boxes // CellSize).astype(int).tolist()
 
-            if IntersectingArea(Rect1, Rect2) is True:
-                FoundIntersectingArea = 1
+    Grid = {}
+    IsKept = [False] * LengthOfBoxCoordinates
+    for I in range(LengthOfBoxCoordinates - 1, -1, -1):
+        FoundIntersectingArea = 0
+        Rect1 = BoxCoordinates[I]
+        CellX1, CellY1, CellX2, CellY2 = Cells[I]
+        BoxCells = [(CellX, CellY) for CellX in range(CellX1, CellX2 + 1) 
+                                   for CellY in range(CellY1, CellY2 + 1)]
+
+        for Cell in BoxCells:
+            for J in Grid.get(Cell, ()):
+                Rect2 = BoxCoordinates[J]
+                if IntersectingArea(Rect1, Rect2) is True:
+                    FoundIntersectingArea = 1
+                    break
+            if FoundIntersectingArea == 1:
                 break
 
         if FoundIntersectingArea == 0:
-            FinalBoxCoordinates.append(BoxCoordinates[I])
+            IsKept[I] = True
+        for Cell in BoxCells:
+            Grid.setdefault(Cell, []).append(I)
+
+    FinalBoxCoordinates = [BoxCoordinates[I] for I in range(LengthOfBoxCoordinates) if IsKept[I]]
 
     return FinalBoxCoordinates
 
@@ -169,128 +232,75 @@ class CornerTag:
 
 ################################################################################
 # Function      : CheckIfCornerBox
-# Parameter     : BoxCoordinates - It contains the coordinates of top left
-#                                  corner and bottom right corner of the
-#                                  boxes as a list of list.
-#                 BoxToCheck - Holds coordinates of the box for which we have
-#                           to confirm whether it is a guiding corner box or not.
-#                 X - x coordinate of the centre of BoxToCheck.
+# Parameter     : Boxes - It contains the coordinates of top left corner and
+#                         bottom right corner of the boxes as an array.
+#                 X - x coordinate of the centre of the boxes.
 #                 Count - Keeps a count of number of boxes which lie in the
-#                         straight line with the BoxToCheck.
-# Description   : This function confirms whether the BoxToCheck is the guiding
-#                 corner boxes or not. It does it by seeing that number of
-#                 boxes in the verticle line of BoxToCheck is greater
-#                 than a particular threshold or not.
+#                         straight line with each box.
+# Description   : This function confirms for all the boxes whether they may be
+#                 the guiding corner boxes or not. It does it by seeing that
+#                 number of boxes in the verticle line of the box is greater
+#                 than a particular threshold or not. The boxes in the line
+#                 are counted from the sorted left and right sides of boxes.
 #                 {This might give false output also if the image is not straight}
-# Return        : True - If it is a guiding corner box
-#                 False - If it is not a guiding corner box
+# Return        : Array of flags, True if the box is a guiding corner box.
 ################################################################################
-def CheckIfCornerBox(BoxToCheck, BoxCoordinates):
-    Count = 0
-    X = (BoxToCheck[0] + BoxToCheck[2])/2
+def CheckIfCornerBox(Boxes):
+    X = (Boxes[:, 0] + Boxes[:, 2])/2
 
-    for Box in BoxCoordinates:
-        if Box[0] <= X <= Box[2]:
-            Count += 1
-
-    if Count >= M.THRESHOLD_TO_CHECK_IF_CORNER_BOX:     # Threshold Value
-        return True
+    if np.all(Boxes[:, 0] <= Boxes[:, 2]):
+        # Boxes having left side before X less boxes having right side before X.
+        Count = (np.searchsorted(np.sort(Boxes[:, 0]), X, side="right") - 
+                 np.searchsorted(np.sort(Boxes[:, 2]), X, side="left"))
     else:
-        return False
+        Count = np.count_nonzero((Boxes[:, 0] <= X[:, None]) & (X[:, None] <= Boxes[:, 2]), 
+                                 axis=1)
+
+    return Count >= M.THRESHOLD_TO_CHECK_IF_CORNER_BOX     # Threshold Value
 
 
 ################################################################################
 # Function      : FindCornerBox
-# Parameter     : BoxCoordinates - It contains the coordinates of top left
-#                                  corner and bottom right corner of the
-#                                  boxes as a list of list.
+# Parameter     : Boxes - It contains the coordinates of top left corner and
+#                         bottom right corner of the boxes as an array.
+#                 IsCornerBox - Flags returned by CheckIfCornerBox.
 #                 Corner - This is object of class CornerTag passed. Will find
 #                          corner guiding box nearest to this corner.
 #                 IterateTill - Holds the shorter side length value of image so
-#                               that loop does not exceed the image.
-#                 X, Y - x&y coordinate of the corner nearer to which guiding
-#                        corner is being found.
-#                 NumOfIterations - Keeps a count of number of iterations.
-#                 FoundCorner - Flag for if corner is found or not.
-#                 CornerBoxFound - Holds coordinates of the corner box found.
+#                               that square does not exceed the image.
+#                 Side_X, Side_Y - Iteration at which the expanding square
+#                                  touches the box from its x and y side.
+#                 Touch_X, Touch_Y - Iteration at which the box collides with
+#                                    the expanding square from its x and y
+#                                    side if it does. (-1 if it does not)
+#                 Iteration - First iteration at which the box collides with
+#                             the expanding square.
 # Description   : This function finds the tentative guiding corner box of the OMR
-#                 nearer to the corner asked and then confirms if by calling
-#                 CheckIfCornerBox.
+#                 nearer to the corner asked. A square is expanded from the
+#                 corner and the first box(confirmed by CheckIfCornerBox) it
+#                 collides with is the corner box. The iteration at which each
+#                 box collides is found directly from its coordinates.
 #                 {This might give false output also if the image is not straight}
 # Return        : CornerBoxFound
 ################################################################################
-def FindCornerBox(BoxCoordinates, Corner, IterateTill):
-    X = Corner.StartX
-    Y = Corner.StartY
-    NumOfIterations = 0
-    FoundCorner = 0
-
-    while NumOfIterations < IterateTill:
-        for Box in BoxCoordinates:
-            # For top left corner
-            if Corner.Name == "TL":                                           
-                if X == Box[Corner.CheckX] and Y >= Box[Corner.CheckX + 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-                elif Y == Box[Corner.CheckY] and X >= Box[Corner.CheckY - 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-
-            # For top right corner
-            elif Corner.Name == "TR":                                         
-                if X == Box[Corner.CheckX] and Y >= Box[Corner.CheckX + 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-                elif Y == Box[Corner.CheckY] and X <= Box[Corner.CheckY - 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-
-            # For bottom right corner
-            elif Corner.Name == "BR":                                         
-                if X == Box[Corner.CheckX] and Y <= Box[Corner.CheckX + 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-                elif Y == Box[Corner.CheckY] and X <= Box[Corner.CheckY - 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-
-            # For bottom left corner
-            elif Corner.Name == "BL":                                         
-                if X == Box[Corner.CheckX] and Y <= Box[Corner.CheckX + 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-                elif Y == Box[Corner.CheckY] and X >= Box[Corner.CheckY - 1]:
-                    if CheckIfCornerBox(Box, BoxCoordinates):
-                        CornerBoxFound = Box
-                        FoundCorner = 1
-                        break
-
-        if FoundCorner:
-            break
+def FindCornerBox(Boxes, IsCornerBox, Corner, IterateTill):
+    Side_X = (Boxes[:, Corner.CheckX] - Corner.StartX) * Corner.IncX
+    Side_Y = (Boxes[:, Corner.CheckY] - Corner.StartY) * Corner.IncY
 
-        X += Corner.IncX
-        Y += Corner.IncY
-        NumOfIterations += 1
+    Touch_X = np.where(Side_X >= (Boxes[:, Corner.CheckX + 1] - Corner.StartY) * Corner.IncY, 
+                       Side_X, -1)
+    Touch_Y = np.where(Side_Y >= (Boxes[:, Corner.CheckY - 1] - Corner.StartX) * Corner.IncX, 
+                       Side_Y, -1)
 
-    if FoundCorner:
-        return CornerBoxFound
-    else:
+    Iteration = np.where((Touch_X >= 0) & ((Touch_X <= Touch_Y) | (Touch_Y < 0)), Touch_X, Touch_Y)
+    Iteration = np.where((Iteration >= 0) & (Iteration < IterateTill) & IsCornerBox, 
+                         Iteration, IterateTill)
+
+    if len(Iteration) == 0 or Iteration.min() == IterateTill:
         print("Corner not found for - " + Corner.Name)
-        return CornerBoxFound
+        return None
+
+    return Boxes[np.argmin(Iteration)].tolist()
 
 
 ################################################################################
@@ -303,6 +313,8 @@ def FindCornerBox(BoxCoordinates, Corner, IterateTill):
 #                 TL/TR/BR/BL CornerTag - These are objects of class CornerTag.
 # Description   : This function finds the guiding corner boxes of the OMR.
 #                 {This might give false output also if the image is not straight}
+#                 ValueError naming the corners is raised if any of them is not
+#                 found.
 # Return        : GuidingCornerBoxes
 ################################################################################
 def FindGuidingCornerBoxes(BoxCoordinates, ImageShape):
@@ -313,6 +325,9 @@ def FindGuidingCornerBoxes(BoxCoordinates, ImageShape):
     else:
         IterateTill = ImageShape[1]
 
+    Boxes = np.asarray(BoxCoordinates, dtype=int).reshape(-1, 4)
+    IsCornerBox = CheckIfCornerBox(Boxes)
+
     # Creating objects
     TLCornerTag = CornerTag("TL", 0, 0, 1, 1, 0, 1)
     TRCornerTag = CornerTag("TR", (ImageShape[1] - 1), 0, -1, 1, 2, 1)
@@ -320,10 +335,15 @@ def FindGuidingCornerBoxes(BoxCoordinates, ImageShape):
     BLCornerTag = CornerTag("BL", 0, (ImageShape[0] - 1), 1, -1, 0, 3)
 
     # Calling FindCornerBox and appending the GuidingCornerBox list.
-    GuidingCornerBoxes.append(FindCornerBox(BoxCoordinates, TLCornerTag, IterateTill))
-    GuidingCornerBoxes.append(FindCornerBox(BoxCoordinates, TRCornerTag, IterateTill))
-    GuidingCornerBoxes.append(FindCornerBox(BoxCoordinates, BRCornerTag, IterateTill))
-    GuidingCornerBoxes.append(FindCornerBox(BoxCoordinates, BLCornerTag, IterateTill))
+    GuidingCornerBoxes.append(FindCornerBox(Boxes, IsCornerBox, TLCornerTag, IterateTill))
+    GuidingCornerBoxes.append(FindCornerBox(Boxes, IsCornerBox, TRCornerTag, IterateTill))
+    GuidingCornerBoxes.append(FindCornerBox(Boxes, IsCornerBox, BRCornerTag, IterateTill))
+    GuidingCornerBoxes.append(FindCornerBox(Boxes, IsCornerBox, BLCornerTag, IterateTill))
+
+    NotFound = [Tag.Name for Tag, Box in zip([TLCornerTag, TRCornerTag, BRCornerTag, BLCornerTag], 
+                                             GuidingCornerBoxes) if Box is None]
+    if len(NotFound) > 0:
+        raise ValueError("Guiding corner box not found for - " + ", ".join(NotFound))
 
     return GuidingCornerBoxes
 
@@ -347,38 +367,61 @@ def CenterOfBoxes(Boxes):
     return BoxesCenter
 
 
+################################################################################
+# Function      : MakeIntegralImage
+# Parameter     : MaskedImage - Contains the image masked for black colour.
+# Description   : This function makes the integral image of non black pixels
+#                 of the masked image, from which the number of non black
+#                 pixels in any rectangle can be found in constant time.
+# Return        : IntegralImage
+################################################################################
+def MakeIntegralImage(MaskedImage):
+    return cv2.integral(np.uint8(MaskedImage != 0))
+
+
+################################################################################
+# Function      : CountNonBlack
+# Parameter     : IntegralImage - Integral image of non black pixels.
+#                 x1, y1, x2, y2 - Corners of rectangle(both included). They
+#                                  can also be arrays of many rectangles.
+# Description   : This function counts non black pixels in the rectangle.
+# Return        : Number of non black pixels.
+################################################################################
+def CountNonBlack(IntegralImage, x1, y1, x2, y2):
+    return (IntegralImage[y2 + 1, x2 + 1] - IntegralImage[y1, x2 + 1] - 
+            IntegralImage[y2 + 1, x1] + IntegralImage[y1, x1])
+
+
 ################################################################################
 # Function      : CheckBoundaryForAllBlack
 # Parameter     : FoundWhite - Flag for if non black pixel is found on the
 #                              boundary.(True if non black found and False if not).
+#                 IntegralImage - Integral image of non black pixels of masked
+#                                 image. Each side of boundary is checked from
+#                                 it in constant time.
 #                 {Rest parameters are self explanatory}
 # Description   : This function checks the boundary of the box for all black
 #                 pixel.
 # Return        : True - If all are black on the boundary.
 #                 False - If all are not black on the boundary.
 ################################################################################
-def CheckBoundaryForAllBlack(x1, y1, x2, y2, MaskedImage):
-    FoundWhite = False
+def CheckBoundaryForAllBlack(x1, y1, x2, y2, MaskedImage, IntegralImage=None):
+    if IntegralImage is None:
+        IntegralImage = MakeIntegralImage(MaskedImage)
+
     # Flag for boundary with white pixel [Top, Right, Bottom, Left] - order used.
     BoundaryWithWhite = [0, 0, 0, 0]      
 
-    for i in range(x1, (x2+1)):                     # Moving right
-        if MaskedImage[y1][i] != 0:                 # Checking top boundary
-            FoundWhite = True
-            BoundaryWithWhite[0] = 1
-
-        if MaskedImage[y2][i] != 0:                 # Checking bottom boundary
-            FoundWhite = True
-            BoundaryWithWhite[2] = 1
+    if CountNonBlack(IntegralImage, x1, y1, x2, y1) != 0:       # Checking top boundary
+        BoundaryWithWhite[0] = 1
+    if CountNonBlack(IntegralImage, x2, y1, x2, y2) != 0:       # Checking right boundary
+        BoundaryWithWhite[1] = 1
+    if CountNonBlack(IntegralImage, x1, y2, x2, y2) != 0:       # Checking bottom boundary
+        BoundaryWithWhite[2] = 1
+    if CountNonBlack(IntegralImage, x1, y1, x1, y2) != 0:       # Checking left boundary
+        BoundaryWithWhite[3] = 1
 
-    for j in range(y1, (y2+1)):                     # Moving down
-        if MaskedImage[j][x1] != 0:                 # Checking left boundary
-            FoundWhite = True
-            BoundaryWithWhite[3] = 1
-
-        if MaskedImage[j][x2] != 0:                 # Checking right boundary
-            FoundWhite = True
-            BoundaryWithWhite[1] = 1
+    FoundWhite = (1 in BoundaryWithWhite)
 
     if FoundWhite:
         return False, BoundaryWithWhite            # Some are white.
@@ -392,36 +435,104 @@ def CheckBoundaryForAllBlack(x1, y1, x2, y2, MaskedImage):
 #                                          of box after shrinking wrt boundary.
 #                 FinalBox - It contains coordinates of individual shrinked box
 #                            and is then appended to ShrinkedBoxCoordinates.
+#                 Steps - Array of all the shrinking steps(by 1 pixel from
+#                         each side) possible for the box.
+#                 AllBlack - Tells for each step if all the pixels on the
+#                            boundary of the shrinked box are black.
+#                 Height, Width - Shape of masked image.
 #                 {Rest parameters are self explanatory}
 # Description   : This function shrinks the boxes wrt the boundary. A box is
 #                 shrinked if all the pixels on the boundary of the box are
-#                 black and the central pixel of the box is not black.
+#                 black and the central pixel of the box is not black. The
+#                 boundaries of all the steps of a box are checked at once from
+#                 the integral image and the last step with all black boundary
+#                 is taken(centre of box does not change while shrinking).
 # Return        : ShrinkedBoxCoordinates
 ################################################################################
-def ShrinkBoxWRTBoundary(BoxCoordinates, MaskedImage):
+def ShrinkBoxWRTBoundary(BoxCoordinates, MaskedImage, IntegralImage=None):
+    if IntegralImage is None:
+        IntegralImage = MakeIntegralImage(MaskedImage)
+
+    Height, Width = MaskedImage.shape[:2]
+
     ShrinkedBoxCoordinates = []
     for Box in BoxCoordinates:
         x1, y1, x2, y2 = Box[0], Box[1], Box[2], Box[3]
         FinalBox = Box
 
-        while x1 <= x2 and y1 <= y2:
+        # Check center of box for non white(Boxes going out of image, e.g. template
+        # matched at edge of a margin strip, are kept as it is.)
+        if x1 <= x2 and y1 <= y2 and x2 < Width and y2 < Height and MaskedImage[int((y2+y1)/2)][int((x1+x2)/2)] != 0:
+            Steps = np.arange(min((x2 - x1)//2, (y2 - y1)//2) + 1)
+            X1, Y1, X2, Y2 = x1 + Steps, y1 + Steps, x2 - Steps, y2 - Steps
+
             # Check Boundary of box for all black.
-            Flag, BoundaryWithWhite = CheckBoundaryForAllBlack(x1, y1, x2, y2, MaskedImage)
-            if Flag:
-                # Check center of box for non white
-                if MaskedImage[int((y2+y1)/2)][int((x1+x2)/2)] != 0:
-                    FinalBox = [x1, y1, x2, y2]
+            AllBlack = ((CountNonBlack(IntegralImage, X1, Y1, X2, Y1) == 0) &
+                        (CountNonBlack(IntegralImage, X2, Y1, X2, Y2) == 0) &
+                        (CountNonBlack(IntegralImage, X1, Y2, X2, Y2) == 0) &
+                        (CountNonBlack(IntegralImage, X1, Y1, X1, Y2) == 0))
 
-            x1 += 1
-            y1 += 1
-            x2 -= 1
-            y2 -= 1
+            if AllBlack.any():
+                Step = int(Steps[AllBlack][-1])
+                FinalBox = [x1 + Step, y1 + Step, x2 - Step, y2 - Step]
 
         ShrinkedBoxCoordinates.append(FinalBox)
 
     return ShrinkedBoxCoordinates
 
 
+################################################################################
+# Function      : ExpandBoxTillBlack
+# Parameter     : x1, y1, x2, y2 - Box to be expanded.
+#                 IntegralImage - Integral image of non black pixels of masked
+#                                 image.
+#                 ValueChanged - Flag to break loop if not expanded from any side.
+#                 {Rest parameters are self explanatory}
+# Description   : This function expands the box from the sides having non black
+#                 pixels on them till all the pixels on its boundary are black
+#                 (0 value) or its area gets above the max limit.
+# Return        : x1, y1, x2, y2
+################################################################################
+def ExpandBoxTillBlack(x1, y1, x2, y2, MaskedImage, IntegralImage):
+    Height, Width = MaskedImage.shape[:2]
+
+    while 1:
+        ValueChanged = 0            # Flag to break loop if expanded from all sides.
+        #print("({}, {}, {}, {})".format(x1, y1, x2, y2))
+        #Copy3 = Copy2.copy()
+        #cv2.rectangle(Copy3, (x1, y1), (x2, y2), (0, 0, 255), thickness=1)
+        #cv2.imshow("Running code on contour", Copy3)
+        #cv2.waitKey(1)
+        
+        # Check Boundary of box for all black.
+        Flag, BoundaryWithWhite = CheckBoundaryForAllBlack(x1, y1, x2, y2, MaskedImage, IntegralImage)
+        Area = ((x2 - x1)*(y2 - y1))
+        # Again checking max area limit to break if exceeded
+        if Area >= M.MAX_CONTOUR_AREA:
+            # Don't save box which may increase above limits in area.
+            break
+        # Expanding rectangle
+        if not Flag:
+            if BoundaryWithWhite[0] == 1 and y1 > 0:            # Top edge
+                y1 -= 1
+                ValueChanged = 1
+            if BoundaryWithWhite[1] == 1 and x2 < (Width - 2):  # Right edge
+                x2 += 1
+                ValueChanged = 1
+            if BoundaryWithWhite[2] == 1 and y2 < (Height -2):  # Bottom edge
+                y2 += 1
+                ValueChanged = 1
+            if BoundaryWithWhite[3] == 1 and x1 > 0:            # Left edge
+                x1 -= 1
+                ValueChanged = 1
+            if ValueChanged == 0:
+                break
+        else:
+            break
+
+    return x1, y1, x2, y2
+
+
 ################################################################################
 # Function      : FindGuidingBoxes_ContourLogic
 # Parameter     : BoxCoordinates - It contains the coordinates of top left boxes 
@@ -435,9 +546,9 @@ def ShrinkBoxWRTBoundary(BoxCoordinates, MaskedImage):
 ################################################################################
 def FindGuidingBoxes_ContourLogic(MaskedImage):
     BoxCoordinates = []
-    Height, Width = MaskedImage.shape[:2]
 
     MaskedCopy = MaskedImage.copy()
+    IntegralImage = MakeIntegralImage(MaskedImage)
     #Copy2 = Image.copy()
 
     # Finding edges and then contours.
@@ -451,40 +562,7 @@ def FindGuidingBoxes_ContourLogic(MaskedImage):
         # Crecking conditions of shape(verticle box or horizontal box) and area.
         if w > h and w*h >= M.MIN_CONTOUR_AREA and w*h <= M.MAX_CONTOUR_AREA:
             # Expanding box wrt boundaries till total black.
-            x1, y1, x2, y2 = x, y, x+w-1, y+h-1
-            while 1:
-                ValueChanged = 0            # Flag to break loop if expanded from all sides.
-                #print("({}, {}, {}, {})".format(x1, y1, x2, y2))
-                #Copy3 = Copy2.copy()
-                #cv2.rectangle(Copy3, (x1, y1), (x2, y2), (0, 0, 255), thickness=1)
-                #cv2.imshow("Running code on contour", Copy3)
-                #cv2.waitKey(1)
-                
-                # Check Boundary of box for all black.
-                Flag, BoundaryWithWhite = CheckBoundaryForAllBlack(x1, y1, x2, y2, MaskedImage)
-                Area = ((x2 - x1)*(y2 - y1))
-                # Again checking max area limit to break if exceeded
-                if Area >= M.MAX_CONTOUR_AREA:
-                    # Don't save box which may increase above limits in area.
-                    break
-                # Expanding rectangle
-                if not Flag:
-                    if BoundaryWithWhite[0] == 1 and y1 > 0:            # Top edge
-                        y1 -= 1
-                        ValueChanged = 1
-                    if BoundaryWithWhite[1] == 1 and x2 < (Width - 2):  # Right edge
-                        x2 += 1
-                        ValueChanged = 1
-                    if BoundaryWithWhite[2] == 1 and y2 < (Height -2):  # Bottom edge
-                        y2 += 1
-                        ValueChanged = 1
-                    if BoundaryWithWhite[3] == 1 and x1 > 0:            # Left edge
-                        x1 -= 1
-                        ValueChanged = 1
-                    if ValueChanged == 0:
-                        break
-                else:
-                    break
+            x1, y1, x2, y2 = ExpandBoxTillBlack(x, y, x+w-1, y+h-1, MaskedImage, IntegralImage)
             
             # Saving box if allowed
             if SaveBox:
@@ -495,15 +573,163 @@ def FindGuidingBoxes_ContourLogic(MaskedImage):
     #cv2.imshow('Contours', Copy2)
 
     #BoxCoordinates = FilterBoxCoordinates(BoxCoordinates)
+    return FilterBoxCoordinates(ShrinkBoxWRTBoundary(BoxCoordinates, MaskedImage, IntegralImage))
+
+
+################################################################################
+# Function      : FindGuidingBoxes_ConnectedComponentsLogic
+# Parameter     : BinaryImage - Masked image with all non black pixels as 1.
+#                 Stats - Bounding rectangle(x, y, w, h) and area of each
+#                         connected white patch(first one is background).
+#                 X1, Y1, X2, Y2 - Coordinates of boxes with one pixel margin
+#                                  around the white patch.
+#                 EdgeW, EdgeH - Width and height of the rectangle bounding
+#                                the edges of the patch in contour logic.
+#                 Expand - Flags for the boxes which contour logic expands(its
+#                          area is below the max limit).
+#                 {Rest parameters are self explanatory}
+# Description   : This function finds the coordinates of boxes in few calls
+#                 only. All the white patches of masked image are labelled at
+#                 once with their bounding rectangles. Then the patches are 
+#                 filtered for shape and area as in contour logic and a margin
+#                 of one pixel is kept around them(the box which contour logic
+#                 gets by expanding till all the pixels on its boundary are
+#                 black), so both give the same boxes for separate patches.
+#                 Patches closer than M.CC_MORPH_KERNEL_SIZE are joined here
+#                 and patches of less than 3x3 pixels(whose edges are found
+#                 differently) may differ.
+# Return        : return value from FilterBoxCoordinates
+################################################################################
+def FindGuidingBoxes_ConnectedComponentsLogic(MaskedImage):
+    Height, Width = MaskedImage.shape[:2]
+
+    BinaryImage = np.uint8(MaskedImage != 0)
+    # Joining the pixels of a box which are separated by noise.
+    if M.CC_MORPH_KERNEL_SIZE > 1:
+        Kernel = np.ones((M.CC_MORPH_KERNEL_SIZE, M.CC_MORPH_KERNEL_SIZE), np.uint8)
+        BinaryImage = cv2.morphologyEx(BinaryImage, cv2.MORPH_CLOSE, Kernel)
+
+    NumOfLabels, Labels, Stats, Centroids = cv2.connectedComponentsWithStats(BinaryImage, connectivity=8)
+    X, Y, W, H = Stats[1:, 0], Stats[1:, 1], Stats[1:, 2], Stats[1:, 3]
+
+    # Rectangle of the edges of the patch as found by contour logic(one pixel more towards top
+    # and left unless at image boundary).
+    X1, Y1 = np.maximum(X - 1, 0), np.maximum(Y - 1, 0)
+    EdgeW, EdgeH = (X + W - X1), (Y + H - Y1)
+
+    # Checking conditions of shape(verticle box or horizontal box) and area.
+    Keep = (EdgeW > EdgeH) & (EdgeW*EdgeH >= M.MIN_CONTOUR_AREA) & (EdgeW*EdgeH <= M.MAX_CONTOUR_AREA)
+
+    # Margin towards bottom and right is kept(till the second last pixel of image as while 
+    # expanding) unless the area is already above the max limit.
+    Expand = ((EdgeW - 1)*(EdgeH - 1) < M.MAX_CONTOUR_AREA)
+    X2 = np.where(Expand & (X + W - 1 < Width - 2), X + W, X + W - 1)
+    Y2 = np.where(Expand & (Y + H - 1 < Height - 2), Y + H, Y + H - 1)
+
+    BoxCoordinates = np.stack((X1, Y1, X2, Y2), axis=1)[Keep].tolist()
+
     return FilterBoxCoordinates(ShrinkBoxWRTBoundary(BoxCoordinates, MaskedImage))
 
 
+################################################################################
+# Function      : FindGuidingBoxes_PyramidLogic
+# Parameter     : Scale - Factor by which the masked image is reduced to find
+#                         the candidate boxes.(2 ** M.PYRAMID_LEVELS)
+#                 CoarseImage - Reduced masked image.
+#                 Stats - Bounding rectangle(x, y, w, h) and area of each
+#                         connected white patch of CoarseImage.
+#                 Candidates - Candidate boxes(scaled back to masked image).
+#                 x1, y1, x2, y2 - Coordinates of a candidate box.
+#                 x, y, w, h - Bounding rectangle of a white patch of masked
+#                              image inside the candidate box.
+#                 {Rest parameters are self explanatory}
+# Description   : This function finds the candidate boxes at reduced resolution
+#                 and then refines only them at full resolution. White patches
+#                 of reduced image having nearly the shape and area of guiding
+#                 boxes are taken as candidates. White patches of masked image
+#                 inside a candidate are checked for shape and area and then
+#                 expanded till all the pixels on their boundary are black as 
+#                 done for contours in contour logic.
+# Return        : return value from FilterBoxCoordinates
+################################################################################
+def FindGuidingBoxes_PyramidLogic(MaskedImage):
+    BoxCoordinates = []
+    Height, Width = MaskedImage.shape[:2]
+    Scale = 2 ** M.PYRAMID_LEVELS
+
+    IntegralImage = MakeIntegralImage(MaskedImage)
+    CoarseImage = cv2.resize(MaskedImage, (max(Width // Scale, 1), max(Height // Scale, 1)), 
+                             interpolation=cv2.INTER_AREA)
+    NumOfLabels, Labels, Stats, Centroids = cv2.connectedComponentsWithStats(
+                                                np.uint8(CoarseImage >= 128), connectivity=8)
+    X, Y, W, H = Stats[1:, 0], Stats[1:, 1], Stats[1:, 2], Stats[1:, 3]
+
+    # Loose check of shape and area as they are not exact at reduced resolution.
+    Keep = ((W + 1 >= H) & ((W + 1)*(H + 1)*Scale*Scale >= M.MIN_CONTOUR_AREA) & 
+            ((W - 1)*(H - 1)*Scale*Scale <= M.MAX_CONTOUR_AREA))
+
+    # Candidate boxes with a margin of one pixel of reduced image.
+    Candidates = np.stack((np.maximum((X - 1)*Scale, 0), np.maximum((Y - 1)*Scale, 0), 
+                           np.minimum((X + W + 1)*Scale, Width) - 1, 
+                           np.minimum((Y + H + 1)*Scale, Height) - 1), axis=1)[Keep].tolist()
+
+    for x1, y1, x2, y2 in Candidates:
+        # Patches inside the candidate at full resolution(boxes joined at reduced 
+        # resolution get separated here).
+        NumOfLabels, Labels, Stats, Centroids = cv2.connectedComponentsWithStats(
+                        np.uint8(MaskedImage[y1:(y2+1), x1:(x2+1)] != 0), connectivity=8)
+
+        for x, y, w, h, Area in Stats[1:].tolist():
+            # Crecking conditions of shape(verticle box or horizontal box) and area.
+            if w > h and w*h >= M.MIN_CONTOUR_AREA and w*h <= M.MAX_CONTOUR_AREA:
+                # Expanding box wrt boundaries till total black.
+                BoxCoordinates.append(list(ExpandBoxTillBlack(x1 + x, y1 + y, x1 + x + w - 1, 
+                                                              y1 + y + h - 1, MaskedImage, IntegralImage)))
+
+    return FilterBoxCoordinates(ShrinkBoxWRTBoundary(BoxCoordinates, MaskedImage, IntegralImage))
+
+
+################################################################################
+# Function      : LoadTemplateImages
+# Parameter     : TemplateImagesFolderPath - Path of template images' folder.
+#                 TemplateImage - It reads the template image of guiding boxes.
+#                 TemplateImages - List of gray template images of all sizes
+#                                  in the order they are matched.
+# Description   : This function reads all the template images, resizes each of
+#                 them to enlarged and diminished sizes and converts them to
+#                 gray. It is done only once per process for a folder and the
+#                 templates are then taken from TemplateImagesCache.
+# Return        : TemplateImages
+################################################################################
+def LoadTemplateImages(TemplateImagesFolderPath):
+    with TemplateImagesCacheLock:
+        if TemplateImagesFolderPath in TemplateImagesCache:
+            return TemplateImagesCache[TemplateImagesFolderPath]
+
+        TemplateImages = []
+        for ImageName in os.listdir(TemplateImagesFolderPath):
+            TemplateImage = cv2.imread(TemplateImagesFolderPath + "/" + ImageName)
+            TemplateImageSize = TemplateImage.shape
+
+            # For enlarging template image and then for diminishing it.
+            for Sign in [1, -1]:
+                for i in range(3):
+                    TemplateImageResized = cv2.resize(TemplateImage, 
+                                                      (TemplateImageSize[1] + Sign*i, 
+                                                       TemplateImageSize[0] + Sign*i))
+                    TemplateImages.append(cv2.cvtColor(TemplateImageResized, cv2.COLOR_BGR2GRAY))
+
+        TemplateImagesCache[TemplateImagesFolderPath] = TemplateImages
+        return TemplateImages
+
+
 ################################################################################
 # Function      : FindGuidingBoxes_TemplateLogic
 # Parameter     : FinalBoxCoordinates - Final list of boxes which donot
 #                                        have any intersecting boxes.
 #                 TemplateImagesFolderPath - Path of template images' folder.
-#                 TemplateImage - It reads the template image of guiding boxes.
+#                 TemplateImage - Gray template image of guiding boxes of a
+#                                 size.(From LoadTemplateImages)
 #                 BoxCoordinates - It contains the coordinates of top left
 #                                   corner and bottom right corner of the
 #                                   guiding boxes as a list of list.
@@ -514,35 +740,17 @@ def FindGuidingBoxes_ContourLogic(MaskedImage):
 #                 the masked OMR image and then filtering out repeating boxes.
 # Return        : return value from FilterBoxCoordinates
 ################################################################################
-def FindGuidingBoxes_TemplateLogic(MaskedImage):
+def FindGuidingBoxes_TemplateLogic(MaskedImage, Context):
     FinalBoxCoordinates = []
 
     TemplateImagesFolderPath = os.path.abspath(os.path.join('TemplateImages'))
 
-    # Read all template images and run.
-    for ImageName in os.listdir(TemplateImagesFolderPath):
-        TemplateImage = cv2.imread(TemplateImagesFolderPath + "/" + ImageName)
-        TemplateImageSize = TemplateImage.shape
-
-        # For enlarging template image.
-        for i in range(3):
-            TemplateImageResized = cv2.resize(TemplateImage, (TemplateImageSize[1] + i, 
-                                                              TemplateImageSize[0] + i))
-
-            BoxCoordinates = TemplateMatching(MaskedImage, TemplateImageResized, Image)
-            RetBoxCoordinates = FilterBoxCoordinates(BoxCoordinates)
-            for j in RetBoxCoordinates:
-                FinalBoxCoordinates.append(j)
-
-        # For diminishing template image.
-        for i in range(3):
-            TemplateImageResized = cv2.resize(TemplateImage, (TemplateImageSize[1] - i, 
-                                                              TemplateImageSize[0] - i))
-            BoxCoordinates = TemplateMatching(MaskedImage, TemplateImageResized, Image)
-
-            RetBoxCoordinates = FilterBoxCoordinates(BoxCoordinates)
-            for j in RetBoxCoordinates:
-                FinalBoxCoordinates.append(j)
+    # Match all sizes of all template images.
+    for TemplateImage in LoadTemplateImages(TemplateImagesFolderPath):
+        BoxCoordinates = TemplateMatching(MaskedImage, TemplateImage, Context.Image)
+        RetBoxCoordinates = FilterBoxCoordinates(BoxCoordinates)
+        for j in RetBoxCoordinates:
+            FinalBoxCoordinates.append(j)
 
     return FilterBoxCoordinates(ShrinkBoxWRTBoundary(FinalBoxCoordinates, MaskedImage))
 
@@ -552,63 +760,54 @@ def FindGuidingBoxes_TemplateLogic(MaskedImage):
 # Parameter     : BoxesList - List of boxes from which true guiding boxes are 
 #                             to be founded.       
 #                 GuidingBoxesList - List of true guiding boxes found.
-#                 CenterInliersList - 2D list of inliers element numbers and 
-#                           inliers count and its first two elements are the 
-#                           element numbers wrt which inliers are being found.
+#                 Centers - Array of coordinates of center of boxes.
+#                 MaxInlierCount, MaxInliers - Inliers count and element
+#                           numbers of inliers of the line having max inliers.
 #                 {Rest parameters are self explanatory.}
 # Description   : This function filters the guiding boxes from the list
-#                 of boxes provided by using logic inspired by RANSAC.
+#                 of boxes provided by using logic inspired by RANSAC. Line
+#                 through every pair of centers is tried and the one having
+#                 max inliers(last one if many) is kept.
 # Return        : GuidingBoxesList
 ################################################################################
 def FilterGuidingBoxes_RansacLogic(BoxesList):
-    CenterOfBoxesList = CenterOfBoxes(BoxesList)
+    Centers = np.array(CenterOfBoxes(BoxesList), dtype=np.int64).reshape(-1, 2)
     GuidingBoxesList = []
-    CenterInliersList = []
-    LengthOfBoxesList = len(CenterOfBoxesList)
+    LengthOfBoxesList = len(Centers)
+    MaxInlierCount = -1
+    MaxInliers = []
 
     # Finding inliers wrt center coordinates.
-    for i in range(LengthOfBoxesList):
-        for j in range((i+1), LengthOfBoxesList):
-            InliersList = [i, j]
-            InlierCount = 0
-            # Now let (x1, y1) & (x2, y2) be the points of line(coordinates of center of boxes).
-            # Slope of this line be "Slope" and its value is ((y2 - y1)/(x2 - x1)).
-            # Let inverse of slope be "B", and its value is ((x2 - x1)/(y2 - y1)).
-            # Let "A" be of value (x1 - y1*B).
-            # Here "A" & "B" are constants.
-            # Value of x-coordinate of a point on line at y-coordinate y3 is (X = A + y3*B).
-            # To check if the center  is inlier, the value (X - x-coordinate of center) must lie
-            # between +-(M.MAX_INLIER_DIST).
-
-            if (CenterOfBoxesList[j][1] - CenterOfBoxesList[i][1]) == 0:
-                B = 100000                                      # A big value
-            else:
-                B = ((CenterOfBoxesList[j][0] - CenterOfBoxesList[i][0]) /\
-                     (CenterOfBoxesList[j][1] - CenterOfBoxesList[i][1]))
-            A = (CenterOfBoxesList[i][0] - (CenterOfBoxesList[i][1] * B))
-
-            for k in range(LengthOfBoxesList):
-                X = (A + (CenterOfBoxesList[k][1] * B))
-                if (-(M.MAX_INLIER_DIST)) <= (X - CenterOfBoxesList[k][0]) <=\
-                      M.MAX_INLIER_DIST:
-                    InliersList.append(k)
-                    InlierCount += 1
-            
-            InliersList.append(InlierCount)
-            # Appending the CenterInliersList list.
-            CenterInliersList.append(InliersList)
-
-    # Finding list with max inlier details. 
-    MaxInlierList = [0]
-    for InlierList in CenterInliersList:
-        if InlierList[-1] >= MaxInlierList[-1]:
-            MaxInlierList = InlierList
-    
-    #print(MaxInlierList)
+    # For center i, lines through it and all the centers j after it are checked at once.
+    # Rows of InliersMatrix are the lines(j) and its columns are the centers(k).
+    for i in range(LengthOfBoxesList - 1):
+        # Now let (x1, y1) & (x2, y2) be the points of line(coordinates of center of boxes).
+        # Slope of this line be "Slope" and its value is ((y2 - y1)/(x2 - x1)).
+        # Let inverse of slope be "B", and its value is ((x2 - x1)/(y2 - y1)).
+        # Let "A" be of value (x1 - y1*B).
+        # Here "A" & "B" are constants.
+        # Value of x-coordinate of a point on line at y-coordinate y3 is (X = A + y3*B).
+        # To check if the center  is inlier, the value (X - x-coordinate of center) must lie
+        # between +-(M.MAX_INLIER_DIST).
+        Diff = Centers[(i+1):] - Centers[i]
+        B = np.full(len(Diff), 100000.0)                        # A big value
+        NonZero_Y = Diff[:, 1] != 0
+        B[NonZero_Y] = Diff[NonZero_Y, 0] / Diff[NonZero_Y, 1]
+        A = (Centers[i][0] - (Centers[i][1] * B))
+
+        Dist = (A[:, None] + (Centers[:, 1] * B[:, None])) - Centers[:, 0]
+        InliersMatrix = ((-(M.MAX_INLIER_DIST)) <= Dist) & (Dist <= M.MAX_INLIER_DIST)
+        InlierCount = np.count_nonzero(InliersMatrix, axis=1)
+
+        # Last line having max inliers is kept.
+        j = len(InlierCount) - 1 - np.argmax(InlierCount[::-1])
+        if InlierCount[j] >= MaxInlierCount:
+            MaxInlierCount = InlierCount[j]
+            MaxInliers = np.flatnonzero(InliersMatrix[j])
 
     # Storing the values of boxes which are in maximum inliers.
-    for i in range(2, (len(MaxInlierList) - 1)):
-        GuidingBoxesList.append(BoxesList[MaxInlierList[i]])
+    for i in MaxInliers:
+        GuidingBoxesList.append(BoxesList[i])
 
     return GuidingBoxesList
 
@@ -629,16 +828,11 @@ def FilterGuidingBoxes_RansacLogic(BoxesList):
 ################################################################################
 def FilterGuidingBoxes_ScoreLogic(BoxesList):
     GuidingBoxesList = []
-    Scores = []
+    Boxes = np.asarray(BoxesList).reshape(-1, 4)
 
-    # Finding score and storing it.
-    for BoxToBeScored in BoxesList:
-        Score = 0
-        for Box in BoxesList:
-            if Box[2] > BoxToBeScored[0] and Box[0] < BoxToBeScored[2]:
-                Score += 1
-
-        Scores.append(Score)
+    # Finding score of all boxes at once(rows are boxes to be scored).
+    Scores = np.count_nonzero((Boxes[:, 2] > Boxes[:, 0, None]) & (Boxes[:, 0] < Boxes[:, 2, None]), 
+                              axis=1)
 
     # Comparing score with threshold and saving it as guiding box.
     for i in range(len(Scores)):
@@ -738,38 +932,53 @@ def SplitAndFindGuidingBoxes(BoxCoordinates, HalfWidthOfImage, GuidingCornerBoxe
 
 ################################################################################
 # Function      : ShrinkTotalBox
-# Parameter     : {All the parameters are explanatory.}
-# Description   : This function shrinks the box to the guiding box completely.
-#                 It does it by storing all the x and y coordinates of those
-#                 pixels which do not have black colour in XCoordinates and
-#                 YCoordinates respectively. Then the shrinked box will have
-#                 coordinates of top left corner as (min(XCoordinates),
-#                 min(YCoordinates)) and the bottom right corner as
-#                 (max(XCoordinates), max(YCoordinates)).
+# Parameter     : Boxes - Boxes as an array(one row for each box).
+#                 Ys, Xs - Rows and cols of masked image covered by each box,
+#                          boxes are padded to the size of the largest box.
+#                 IsInside - Flags for the pixels(of padded boxes) which are
+#                            inside the box and the image.
+#                 Patches - Flags for the pixels inside the boxes which are not
+#                           black, stacked for all the boxes.
+#                 RowsAny, ColsAny - Rows and cols of each box which have
+#                                    atleast one pixel which is not black.
+#                 {Rest parameters are explanatory.}
+# Description   : This function shrinks the boxes to the guiding boxes completely.
+#                 The shrinked box will have its top left corner at the first
+#                 row and col and bottom right corner at the last row and col
+#                 of the box having pixels which do not have black colour.
+#                 (If box has no such pixel, it is kept as it is.) All the boxes
+#                 are shrinked together from one stack of their pixels.
 # Return        : FinalBoxCoordinates
 ################################################################################
 def ShrinkTotalBox(BoxCoordinates, MaskedImage):
-    FinalBoxCoordinates = []
+    if len(BoxCoordinates) == 0:
+        return []
 
-    for Box in BoxCoordinates:
-        XCoordinates = []
-        YCoordinates = []
-        x1, y1, x2, y2 = Box[0], Box[1], Box[2], Box[3]
+    Height, Width = MaskedImage.shape[:2]
+    Boxes = np.asarray(BoxCoordinates, dtype=int).reshape(-1, 4)
+    x1, y1, x2, y2 = Boxes[:, 0], Boxes[:, 1], Boxes[:, 2], Boxes[:, 3]
 
-        for i in range(x1, (x2+1)):
-            for j in range(y1, (y2+1)):
-                # MaskedImage[j][i]
-                if MaskedImage[j][i] != 0:
-                    XCoordinates.append(i)
-                    YCoordinates.append(j)
+    Ys = y1[:, None] + np.arange(max(int((y2 - y1).max()) + 1, 1))
+    Xs = x1[:, None] + np.arange(max(int((x2 - x1).max()) + 1, 1))
+    IsInsideRow = (Ys <= y2[:, None]) & (Ys >= 0) & (Ys < Height)
+    IsInsideCol = (Xs <= x2[:, None]) & (Xs >= 0) & (Xs < Width)
+    IsInside = IsInsideRow[:, :, None] & IsInsideCol[:, None, :]
 
-        XCoordinates = sorted(XCoordinates)
-        YCoordinates = sorted(YCoordinates)
+    Patches = MaskedImage[np.clip(Ys, 0, Height - 1)[:, :, None], np.clip(Xs, 0, Width - 1)[:, None, :]] != 0
+    Patches &= IsInside
 
-        FinalBoxCoordinates.append([XCoordinates[0], YCoordinates[0], XCoordinates[-1], 
-                                    YCoordinates[-1]])
+    RowsAny = Patches.any(axis=2)
+    ColsAny = Patches.any(axis=1)
+    IsEmpty = ~RowsAny.any(axis=1)
 
-    return FinalBoxCoordinates
+    FirstRow = RowsAny.argmax(axis=1)
+    LastRow = RowsAny.shape[1] - 1 - RowsAny[:, ::-1].argmax(axis=1)
+    FirstCol = ColsAny.argmax(axis=1)
+    LastCol = ColsAny.shape[1] - 1 - ColsAny[:, ::-1].argmax(axis=1)
+
+    ShrinkedBoxes = np.stack([x1 + FirstCol, y1 + FirstRow, x1 + LastCol, y1 + LastRow], axis=1).tolist()
+
+    return [list(BoxCoordinates[i]) if IsEmpty[i] else ShrinkedBoxes[i] for i in range(len(Boxes))]
 
 
 ################################################################################
@@ -778,6 +987,8 @@ def ShrinkTotalBox(BoxCoordinates, MaskedImage):
 #                             filter boxes.
 #                 LengthReq - The length of BoxesList required to match other 
 #                             list of guiding boxes.
+#                 Low, High - Range in which DifferenceInArea of each box is
+#                             being binary searched.
 #                 {Rest parameters are self explanatory}
 # Description   : This function applies the ransac motivated algo on the areas 
 #                 of boxes to find the most related boxes of required number.
@@ -786,83 +997,248 @@ def ShrinkTotalBox(BoxCoordinates, MaskedImage):
 #                 close to each other and the outliers will have different areas 
 #                 and their point on the axis will be at some distance thus the 
 #                 areas of required boxes will form a cluster and the axis will 
-#                 contain some outliers. We will for each box area, see how many 
-#                 boxes have area in the range of -to+ of DifferenceInArea from 
-#                 that point and these points are known as inliers for that point 
-#                 for a particular lenth DifferenceInArea. After getting this, 
-#                 we will check that if any box have LengthReq number of inliers 
-#                 thus those areas will correspond to guiding boxes. If no such 
-#                 cluster is found for a value of DifferenceInArea, then we will 
-#                 increment this value by 1 and check again. Small increments 
-#                 are done to avoid involving outliers.
+#                 contain some outliers. For each box area, boxes having area in 
+#                 the range of -to+ of DifferenceInArea from that point are known 
+#                 as inliers for that point. We need the smallest DifferenceInArea 
+#                 for which some box has exactly LengthReq inliers(first such box 
+#                 is taken) as those areas will correspond to guiding boxes.
+#                 Smallest DifferenceInArea of each box having atleast LengthReq 
+#                 inliers is binary searched on the sorted areas for all boxes 
+#                 at once. Small DifferenceInArea avoids involving outliers.
 # Return        : FinalBoxesList - If required number of boxes are found
 #                 BoxesList - If required number of boxes are not found.
 ################################################################################
 def RANSAC_OnArea(BoxesList, LengthReq, ImageArea):
     FinalBoxesList = []
-    AreaOfBoxesList = []
-
-    DifferenceInArea = 0
 
     # Finding area of all respective boxes.
-    for Box in BoxesList:
-        AreaOfBoxesList.append((Box[0] - Box[2])*(Box[1] - Box[3]))
-    
+    Boxes = np.asarray(BoxesList, dtype=np.int64).reshape(-1, 4)
+    AreaOfBoxesList = (Boxes[:, 0] - Boxes[:, 2])*(Boxes[:, 1] - Boxes[:, 3])
+
+    if not (1 <= LengthReq <= len(AreaOfBoxesList)):
+        print("Cannot find inliers wrt area.")
+        return BoxesList
+
+    SortedAreas = np.sort(AreaOfBoxesList)
 
-    while DifferenceInArea <= ImageArea:
-        TotalInliersList = []
-        for i in range(len(AreaOfBoxesList)):
-            InlierCount = 0
-            InlierList = []
-            for j in range(len(AreaOfBoxesList)):
-                if (-(DifferenceInArea)) <= (AreaOfBoxesList[i] - AreaOfBoxesList[j])\
-                                         <= DifferenceInArea:
-                    InlierList.append(j)
-                    InlierCount += 1
-            InlierList.append(InlierCount)
-            TotalInliersList.append(InlierList)
-
-        for InlierList in TotalInliersList:
-            if InlierList[-1] == LengthReq:
-                print("Found all inliers wrt area.")
-                for i in range(len(InlierList)-1):
-                    FinalBoxesList.append(BoxesList[InlierList[i]])
-                #print(AreaOfBoxesList)    
-                return FinalBoxesList
-        DifferenceInArea += 1
-
-    print("Cannot find inliers wrt area.")
-    return BoxesList
+    def CountInliers(DifferenceInArea):
+        return (np.searchsorted(SortedAreas, AreaOfBoxesList + DifferenceInArea, side="right") - 
+                np.searchsorted(SortedAreas, AreaOfBoxesList - DifferenceInArea, side="left"))
+
+    # Binary searching smallest DifferenceInArea for each box having atleast LengthReq inliers.
+    Low = np.zeros(len(AreaOfBoxesList), dtype=np.int64)
+    High = np.full(len(AreaOfBoxesList), SortedAreas[-1] - SortedAreas[0])
+    while np.any(Low < High):
+        Mid = (Low + High) // 2
+        IsEnough = CountInliers(Mid) >= LengthReq
+        High = np.where(IsEnough, Mid, High)
+        Low = np.where(IsEnough, Low, Mid + 1)
+
+    # Box must have exactly LengthReq inliers at it.
+    IsValid = (CountInliers(Low) == LengthReq) & (Low <= ImageArea)
+    if not np.any(IsValid):
+        print("Cannot find inliers wrt area.")
+        return BoxesList
+
+    DifferenceInArea = Low[IsValid].min()
+    i = np.flatnonzero(IsValid & (Low == DifferenceInArea))[0]
+
+    print("Found all inliers wrt area.")
+    InlierList = np.flatnonzero(np.abs(AreaOfBoxesList[i] - AreaOfBoxesList) <= DifferenceInArea)
+    for j in InlierList:
+        FinalBoxesList.append(BoxesList[j])
+    return FinalBoxesList
 
 
 ################################################################################
-# Function      : RunCode
+# Function      : FindBoxes
+# Parameter     : MaskedImage - Contains the image masked for black colour.
+#                 Context - DetectionContext of the sheet.
+# Description   : This function finds the boxes in the masked image with the
+#                 logic asked(or coarse to fine if M.PYRAMID_LEVELS is set).
+# Return        : BoxCoordinates
+################################################################################
+def FindBoxes(MaskedImage, Context):
+    if M.PYRAMID_LEVELS > 0:
+        return FindGuidingBoxes_PyramidLogic(MaskedImage)
+    elif M.TEMPLATE_OR_CONTOUR_LOGIC == 0:
+        return FindGuidingBoxes_TemplateLogic(MaskedImage, Context)
+    elif M.TEMPLATE_OR_CONTOUR_LOGIC == 2:
+        return FindGuidingBoxes_ConnectedComponentsLogic(MaskedImage)
+    else:
+        return FindGuidingBoxes_ContourLogic(MaskedImage)
+
+
+################################################################################
+# Function      : FindBoxesInMarginStrips
+# Parameter     : Context - DetectionContext of the sheet.
+#                 StripWidth - Width of left and right margin strips.
+#                 StripStart - x coordinate of start of the strip.
+#                 InnerEdge - x coordinate(in the strip) of the edge of the strip
+#                             towards the centre of the image.
+#                 MaskedImage - Masked image of size of complete image having
+#                               masked strips(rest of it is black).
+#                 StripBoxes - Boxes found in the strip.
+# Description   : This function masks and finds boxes only in the left and
+#                 right margin strips of the image as the guiding boxes lie
+#                 there only. Boxes are moved to the coordinates of complete
+#                 image. If a strip does not have enough boxes for corner boxes
+#                 to be found or if a box touches the inner edge of the strip
+#                 (box may be cut by the strip), complete image must be used.
+# Return        : MaskedImage, BoxCoordinates - If boxes are found correctly
+#                 None, None - If boxes are not found correctly
+################################################################################
+def FindBoxesInMarginStrips(Context):
+    Width = Context.Image.shape[1]
+    StripWidth = int(Width * M.MARGIN_STRIP_WIDTH_RATIO)
+    if StripWidth <= 0 or 2*StripWidth >= Width:
+        return None, None
+
+    MaskedImage = np.zeros(Context.Image.shape[:2], dtype=np.uint8)
+    BoxCoordinates = []
+
+    for StripStart, InnerEdge in [(0, StripWidth - 1), ((Width - StripWidth), 0)]:
+        MaskedStrip = MaskImage(Context, Context.Image[:, StripStart:(StripStart + StripWidth)])
+        MaskedImage[:, StripStart:(StripStart + StripWidth)] = MaskedStrip
+
+        StripBoxes = FindBoxes(MaskedStrip, Context)
+        if len(StripBoxes) < M.THRESHOLD_TO_CHECK_IF_CORNER_BOX:
+            return None, None
+
+        # Boxes are not expanded till the last col of image, so a box reaching
+        # the col next to it may also be touching the edge.
+        for Box in StripBoxes:
+            if abs(Box[0] - InnerEdge) <= 1 or abs(Box[2] - InnerEdge) <= 1:
+                return None, None
+            BoxCoordinates.append([Box[0] + StripStart, Box[1], Box[2] + StripStart, Box[3]])
+
+    return MaskedImage, BoxCoordinates
+
+
+################################################################################
+# Function      : TrackCornerBoxes
+# Parameter     : InputImage - Input image of OMR sheet.
+#                 PrevCornerBoxes - The 4 corner guiding boxes of the previous
+#                                   sheet in clockwise order starting from top
+#                                   left.
+#                 UpperLimitOfValue - Upper limit of "Value" for masking. If not
+#                       passed, it is found by checking brightness of the image.
+#                 X1, Y1, X2, Y2 - Window around the previous box in which it
+#                                  is searched.
+#                 Stats - Stats of the patches found in masked window.
+#                 IsBox - Tells for each patch if it can be the box. It must lie
+#                         completely inside the window(unless window touches
+#                         the image boundary) and its size must be nearly the
+#                         size of previous box.
+#                 Shift - Distance of centre of patch from previous box centre.
+#                 CornerBoxes - The 4 corner guiding boxes found.
+# Description   : This function finds the corner guiding boxes again near their
+#                 position in the previous sheet. Only small windows around the
+#                 previous boxes are masked and the patch nearest to the
+#                 previous box is taken. If any of the boxes is not found, the
+#                 guiding boxes must be found in the complete image.
+# Return        : CornerBoxes - If all the corner boxes are found
+#                 None - If any of the corner boxes is not found
+################################################################################
+def TrackCornerBoxes(InputImage, PrevCornerBoxes, UpperLimitOfValue=None):
+    if UpperLimitOfValue is None:
+        UpperLimitOfValue = CB.CheckBrightness(InputImage)
+
+    Context = DetectionContext(InputImage, UpperLimitOfValue)
+    Height, Width = InputImage.shape[:2]
+    CornerBoxes = []
+
+    for Box in PrevCornerBoxes:
+        x1, y1, x2, y2 = Box[0], Box[1], Box[2], Box[3]
+        X1, Y1 = max(x1 - M.TRACK_SEARCH_MARGIN, 0), max(y1 - M.TRACK_SEARCH_MARGIN, 0)
+        X2, Y2 = min(x2 + M.TRACK_SEARCH_MARGIN, Width - 1), min(y2 + M.TRACK_SEARCH_MARGIN, Height - 1)
+
+        MaskedWindow = MaskImage(Context, InputImage[Y1:(Y2+1), X1:(X2+1)])
+        NumOfLabels, Labels, Stats, Centroids = cv2.connectedComponentsWithStats(
+                                                    np.uint8(MaskedWindow != 0), connectivity=8)
+        X, Y = Stats[1:, 0] + X1, Stats[1:, 1] + Y1
+        W, H = Stats[1:, 2], Stats[1:, 3]
+
+        IsBox = ((np.abs(W - (x2 - x1 + 1)) <= M.TRACK_SIZE_TOLERANCE) & 
+                 (np.abs(H - (y2 - y1 + 1)) <= M.TRACK_SIZE_TOLERANCE) &
+                 ((X > X1) | (X1 == 0)) & ((Y > Y1) | (Y1 == 0)) &
+                 ((X + W - 1 < X2) | (X2 == Width - 1)) & ((Y + H - 1 < Y2) | (Y2 == Height - 1)))
+        if not np.any(IsBox):
+            return None
+
+        Shift = np.abs((2*X + W - 1) - (x1 + x2)) + np.abs((2*Y + H - 1) - (y1 + y2))
+        i = np.flatnonzero(IsBox)[np.argmin(Shift[IsBox])]
+        CornerBoxes.append([int(X[i]), int(Y[i]), int(X[i] + W[i] - 1), int(Y[i] + H[i] - 1)])
+
+    return CornerBoxes
+
+
+################################################################################
+# Function      : FindLeftAndRightGuidingBoxes
 # Parameter     : MaskedImage - Contains the image masked for black colour.
 #                 BoxCoordinates - List of boxes found.
 #                 GuidingCornerBoxes - List of the 4 guiding corner boxes.
-#                 LeftGuidingBoxes, RightGuidingBoxes - These are list of left 
-#                                                and right guiding boxes found.
 #                 {Rest parameters are self explanatory}
-# Description   : This function calls relevant functions one by one in order
-#                 to run program.
+# Description   : This function finds the guiding corner boxes and then the 
+#                 left and right guiding boxes between them, shrinked to the
+#                 guiding boxes completely. ValueError is raised if guiding
+#                 corner boxes are not found.
 # Return        : LeftGuidingBoxes, RightGuidingBoxes
 ################################################################################
-def RunCode(UpperLimitOfValue):
-    MaskedImage = MaskImage(UpperLimitOfValue)
-
-    # Finding boxes with logic asked.
-    if M.TEMPLATE_OR_CONTOUR_LOGIC == 0:
-        BoxCoordinates = FindGuidingBoxes_TemplateLogic(MaskedImage)
-    else:
-        BoxCoordinates = FindGuidingBoxes_ContourLogic(MaskedImage)
-
-    # Finding guiding corner boxes and their center
+def FindLeftAndRightGuidingBoxes(MaskedImage, BoxCoordinates):
+    # Finding guiding corner boxes
     GuidingCornerBoxes = FindGuidingCornerBoxes(BoxCoordinates, MaskedImage.shape)
+
+    # Finding center of guiding corner boxes
     GuidingCornerBoxesCenter = CenterOfBoxes(GuidingCornerBoxes)
     LeftGuidingBoxes, RightGuidingBoxes = SplitAndFindGuidingBoxes(BoxCoordinates, 
-                                    Image.shape[1] // 2, GuidingCornerBoxesCenter)
-    LeftGuidingBoxes = ShrinkTotalBox(LeftGuidingBoxes, MaskedImage)
-    RightGuidingBoxes = ShrinkTotalBox(RightGuidingBoxes, MaskedImage)
+                                    MaskedImage.shape[1] // 2, GuidingCornerBoxesCenter)
+    # Shrinking left and right guiding boxes together.
+    ShrinkedBoxes = ShrinkTotalBox(LeftGuidingBoxes + RightGuidingBoxes, MaskedImage)
+
+    return ShrinkedBoxes[:len(LeftGuidingBoxes)], ShrinkedBoxes[len(LeftGuidingBoxes):]
+
+
+################################################################################
+# Function      : RunCode
+# Parameter     : Context - DetectionContext of the sheet.
+#                 MaskedImage - Contains the image masked for black colour.
+#                 BoxCoordinates - List of boxes found.
+#                 GuidingBoxes - Left and right guiding boxes found.
+#                 GuidingCornerBoxes - List of the 4 guiding corner boxes.
+#                 LeftGuidingBoxes, RightGuidingBoxes - These are list of left 
+#                                                and right guiding boxes found.
+#                 {Rest parameters are self explanatory}
+# Description   : This function calls relevant functions one by one in order
+#                 to run program. If guiding boxes are not found correctly in
+#                 the margin strips, complete image is searched. ValueError is
+#                 raised if guiding corner boxes are not found there also.
+# Return        : LeftGuidingBoxes, RightGuidingBoxes
+################################################################################
+def RunCode(Context):
+    Image = Context.Image
+
+    # Finding guiding boxes in margin strips if asked. They are found again in complete image
+    # if corner boxes are not found or number of left and right guiding boxes is not equal 
+    # as boxes may be missed in the strips.
+    GuidingBoxes = None
+    if M.DETECT_IN_MARGIN_STRIPS == 1:
+        MaskedImage, BoxCoordinates = FindBoxesInMarginStrips(Context)
+        if BoxCoordinates is not None:
+            try:
+                GuidingBoxes = FindLeftAndRightGuidingBoxes(MaskedImage, BoxCoordinates)
+            except ValueError:
+                pass
+        if GuidingBoxes is not None and len(GuidingBoxes[0]) != len(GuidingBoxes[1]):
+            GuidingBoxes = None
+
+    # Finding guiding boxes with logic asked in complete image.
+    if GuidingBoxes is None:
+        MaskedImage = MaskImage(Context)
+        BoxCoordinates = FindBoxes(MaskedImage, Context)
+        GuidingBoxes = FindLeftAndRightGuidingBoxes(MaskedImage, BoxCoordinates)
+    Context.MaskedImage = MaskedImage
+    LeftGuidingBoxes, RightGuidingBoxes = GuidingBoxes
 
     # Checking if number of left and right guiding boxes found are equal.
     LenOfLeftGB = len(LeftGuidingBoxes)
@@ -907,21 +1283,27 @@ def RunCode(UpperLimitOfValue):
 
 ################################################################################
 # Function      : FindBoundingBoxes
-# Parameter     : Image - Reads the input image of OMR sheet.
-# Description   : This function makes the input OMR image global and calls 
-#                 RunCode to ultimately find the guiding boxes of left side 
-#                 and right side.
+# Parameter     : Image - Reads the input image of OMR sheet(BGR or its "Value"
+#                         plane).
+#                 UpperLimitOfValue - Upper limit of "Value" for masking. If not
+#                       passed, it is found by checking brightness of the image
+#                       (so it must be passed with "Value" plane).
+#                 Context - DetectionContext holding the sheet. Nothing is kept
+#                           in module globals so sheets can be processed by
+#                           many threads at once.
+# Description   : This function makes the detection context of the input OMR 
+#                 image and calls RunCode to ultimately find the guiding boxes 
+#                 of left side and right side.
 # Return        : LeftGuidingBoxes, RightGuidingBoxes
 ################################################################################
-def FindBoundingBoxes(InputImage):
-    global Image
-
-    Image = InputImage.copy()
-
+def FindBoundingBoxes(InputImage, UpperLimitOfValue=None):
     #Checking brightness value and setting upper limit of "Value"
-    UpperLimitOfValue = CB.CheckBrightness(Image)
+    if UpperLimitOfValue is None:
+        UpperLimitOfValue = CB.CheckBrightness(InputImage)
+
+    Context = DetectionContext(InputImage, UpperLimitOfValue)
     
-    LeftGuidingBoxes, RightGuidingBoxes = RunCode(UpperLimitOfValue)
+    LeftGuidingBoxes, RightGuidingBoxes = RunCode(Context)
 
     #cv2.waitKey(1)
     #cv2.destroyAllWindows()
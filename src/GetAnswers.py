@@ -11,6 +11,159 @@ import cv2
 import macros as M
 
 
+# Homogeneous pixel coordinates of question regions of cropped OMR, made once
+# per process for each region. (Filled by SampleQuestionRegion)
+RegionGridCache = {}
+
+
+################################################################################
+# Function      : MakeGrid
+# Parameter     : Height, Width - Height and width of the answer image.
+#                 NumOfRows, NumOfCols - Number of rows and cols of the grid.
+#                 GridHeight, GridWidth - Exact(decimal) height and width of a
+#                                         grid box.
+#                 RowStarts, ColStarts - Pixel coordinates of top and left side
+#                       of the grid boxes. Exact height/width is added again and
+#                       again and then converted to integer so that the decimal
+#                       values skipped do not add up to error.
+#                 RowEnds, ColEnds - Pixel coordinates(excluded) of bottom and
+#                                    right side of the grid boxes.
+# Description   : This function finds the pixel coordinates of all the grid
+#                 boxes of the answer image.
+# Return        : RowStarts, RowEnds, ColStarts, ColEnds
+################################################################################
+def MakeGrid(Height, Width, NumOfRows, NumOfCols):
+    GridHeight = Height/NumOfRows
+    GridWidth = Width/NumOfCols
+
+    RowStarts = np.add.accumulate(np.r_[0., np.full(NumOfRows - 1, GridHeight)]).astype(int)
+    ColStarts = np.add.accumulate(np.r_[0., np.full(NumOfCols - 1, GridWidth)]).astype(int)
+    RowStarts = np.minimum(RowStarts, Height)
+    ColStarts = np.minimum(ColStarts, Width)
+
+    # Leaving the last pixel row and col of each grid box.
+    RowEnds = np.minimum(RowStarts + max(int(GridHeight - 1), 0), Height)
+    ColEnds = np.minimum(ColStarts + max(int(GridWidth - 1), 0), Width)
+
+    return RowStarts, RowEnds, ColStarts, ColEnds
+
+
+################################################################################
+# Function      : MakeGridBoxes
+# Parameter     : C_X, C_Y, Width, Length - Answer area(rectangle) of question.
+#                 SheetHeight, SheetWidth - Height and width of cropped OMR.
+#                 Y1, Y2, X1, X2 - Pixel coordinates of answer area in the
+#                                  sheet(ends excluded), clipped to sheet.
+# Description   : This function finds the pixel coordinates of all the grid
+#                 boxes of a question in the complete sheet.
+# Return        : RowStarts, RowEnds, ColStarts, ColEnds
+################################################################################
+def MakeGridBoxes(C_X, C_Y, Width, Length, NumOfRows, NumOfCols, SheetHeight, SheetWidth):
+    Y1, Y2, _ = slice(C_Y, C_Y + Length).indices(SheetHeight)
+    X1, X2, _ = slice(C_X, C_X + Width).indices(SheetWidth)
+    Y2 = max(Y2, Y1)
+    X2 = max(X2, X1)
+
+    RowStarts, RowEnds, ColStarts, ColEnds = MakeGrid((Y2 - Y1), (X2 - X1), NumOfRows, NumOfCols)
+
+    return RowStarts + Y1, RowEnds + Y1, ColStarts + X1, ColEnds + X1
+
+
+################################################################################
+# Function      : CountInGrid
+# Parameter     : IntegralImage - Integral image(cv2.integral) of the image in
+#                                 which pixels are to be counted.
+#                 RowStarts, RowEnds, ColStarts, ColEnds - Pixel coordinates
+#                       of the grid boxes(ends excluded).
+# Description   : This function finds the sum of pixels of all the grid boxes
+#                 at once. Sum of a box is found from the 4 corners of the box
+#                 in the integral image.
+# Return        : 2D array of the sum for each grid box.
+################################################################################
+def CountInGrid(IntegralImage, RowStarts, RowEnds, ColStarts, ColEnds):
+    Y1, Y2 = RowStarts[:, None], RowEnds[:, None]
+    X1, X2 = ColStarts[None, :], ColEnds[None, :]
+
+    Count = IntegralImage[Y2, X2] - IntegralImage[Y1, X2] - IntegralImage[Y2, X1] + IntegralImage[Y1, X1]
+
+    # Boxes with end before start are empty.
+    return np.where((Y2 > Y1) & (X2 > X1), Count, 0).astype(int)
+
+
+################################################################################
+# Class         : PreparedSheet
+# Parameter     : OMRImage - Image of cropped OMR(BGR or grayscale).
+#                 Origin - Pixel coordinates(row, col) in cropped OMR of top
+#                          left corner of OMRImage if it is only a part of it.
+#                 ThreshImage - Thresholded grayscale image of complete sheet.
+#                 IntegralImage - Integral image of black pixels of ThreshImage.
+# Description   : Holds the cropped OMR sheet thresholded once, so that all the
+#                 questions of the sheet can count black pixels in their grid
+#                 boxes from the same integral image.
+# Return        : -
+################################################################################
+class PreparedSheet:
+    def __init__(self, OMRImage, Origin=(0, 0)):
+        self.Origin = Origin
+        if len(OMRImage.shape) == 3:
+            GrayImage = cv2.cvtColor(OMRImage, cv2.COLOR_BGR2GRAY)
+        else:
+            GrayImage = OMRImage
+
+        ret, self.ThreshImage = cv2.threshold(GrayImage, M.ThresholdImageAt, 255, cv2.THRESH_BINARY)
+        self.IntegralImage = cv2.integral(np.uint8(self.ThreshImage != 255))
+        self.Height, self.Width = self.ThreshImage.shape[:2]
+
+    ################################################################################
+    # Method        : CountBlack
+    # Parameter     : RowStarts, RowEnds, ColStarts, ColEnds - Pixel coordinates
+    #                       of the grid boxes in the sheet(ends excluded).
+    # Description   : This method counts the black pixels in all the grid boxes.
+    # Return        : 2D array of number of black pixels for each grid box.
+    ################################################################################
+    def CountBlack(self, RowStarts, RowEnds, ColStarts, ColEnds):
+        return CountInGrid(self.IntegralImage, RowStarts - self.Origin[0], RowEnds - self.Origin[0], 
+                           ColStarts - self.Origin[1], ColEnds - self.Origin[1])
+
+
+################################################################################
+# Function      : SampleQuestionRegion
+# Parameter     : GrayImage - Gray input image of OMR sheet(not cropped).
+#                 ProjectiveMatrix - Matrix of projective transform from input
+#                                    image to cropped OMR(from FindCropMatrix).
+#                 GridBoxes - Pixel coordinates of grid boxes of the question in
+#                             cropped OMR.
+#                 Y1, Y2, X1, X2 - Region of cropped OMR covering all the grid
+#                                  boxes(ends excluded).
+#                 RegionGrid - Homogeneous coordinates of all pixels of region.
+#                 MapX, MapY - Pixel coordinates in input image of all the
+#                              pixels of region.
+# Description   : This function samples only the region of the question of the
+#                 cropped OMR directly from the input image. Pixels of region
+#                 are mapped back by the inverse of ProjectiveMatrix and read
+#                 by cv2.remap, as cv2.warpPerspective would have read them.
+# Return        : PreparedSheet of the region.
+################################################################################
+def SampleQuestionRegion(GrayImage, ProjectiveMatrix, GridBoxes):
+    RowStarts, RowEnds, ColStarts, ColEnds = GridBoxes
+    Y1, X1 = int(RowStarts.min()), int(ColStarts.min())
+    Y2, X2 = max(int(RowEnds.max()), Y1 + 1), max(int(ColEnds.max()), X1 + 1)
+
+    RegionGrid = RegionGridCache.get((Y1, Y2, X1, X2))
+    if RegionGrid is None:
+        Y, X = np.mgrid[Y1:Y2, X1:X2]
+        RegionGrid = np.stack((X.ravel(), Y.ravel(), np.ones(X.size))).astype(np.float64)
+        RegionGridCache[(Y1, Y2, X1, X2)] = RegionGrid
+
+    SourcePoints = np.linalg.inv(ProjectiveMatrix) @ RegionGrid
+    MapX = (SourcePoints[0] / SourcePoints[2]).astype(np.float32).reshape(Y2 - Y1, X2 - X1)
+    MapY = (SourcePoints[1] / SourcePoints[2]).astype(np.float32).reshape(Y2 - Y1, X2 - X1)
+
+    RegionImage = cv2.remap(GrayImage, MapX, MapY, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+    return PreparedSheet(RegionImage, Origin=(Y1, X1))
+
+
 class FindAnswer:
     ################################################################################
     # Method        : __init__
@@ -36,10 +189,12 @@ class FindAnswer:
     #                 AnswerString - It holds the answer to the question.
     #                 StartFromIndex - It tells if the options are starting
     #                                  from A/0 or any other alphabet/number.
+    #                 GridBoxes - Pixel coordinates of grid boxes in the sheet if
+    #                             already made(as in compiled layout).
     # Description   : This method initialises different parameters for the question.
     # Return        : -
     ################################################################################
-    def __init__(self, Corner_X, Corner_Y, Width, Length, NumOfRows, NumOfCols, By_CorR, Alp_or_Num, StartFromIndex=0):
+    def __init__(self, Corner_X, Corner_Y, Width, Length, NumOfRows, NumOfCols, By_CorR, Alp_or_Num, StartFromIndex=0, GridBoxes=None):
         self.C_X = Corner_X
         self.C_Y = Corner_Y
         self.Width = Width
@@ -51,120 +206,33 @@ class FindAnswer:
         self.HistogramMatrix = np.zeros((NumOfRows, NumOfCols), dtype=int)
         self.AnswerString = ""
         self.StartFromIndex = StartFromIndex
-
-    ################################################################################
-    # Method        : AnswerImage
-    # Parameter     : OMRImage - It holds the OMR sheet image after cropping it
-    #                            from corner circles.
-    # Description   : This method answer area from the OMR image
-    # Return        : -
-    ################################################################################
-    def AnswerImage(self, OMRImage):
-        self.Image = OMRImage[self.C_Y:self.C_Y + self.Length, self.C_X:self.C_X + self.Width]
-        
-    ################################################################################
-    # Method        : ThresholdImage
-    # Parameter     : -
-    # Description   : This method converts the image to thresholded grayscale.
-    # Return        : -
-    ################################################################################
-    def ThresholdImage(self):
-        self.ThreshImage = cv2.cvtColor(self.Image, cv2.COLOR_BGR2GRAY)
-        ret, self.ThreshImage = cv2.threshold(self.ThreshImage, M.ThresholdImageAt, 255, cv2.THRESH_BINARY)
-
-
-    ################################################################################
-    # Method        : FindHistogram
-    # Parameter     : (i, j) - This is the top left coordinate of a grid box.
-    #                 WidthOfGrid - This contains the width of the grid box.
-    #                 HeightOfGrid - This contains the height of the grid box.
-    #                 NumOfWhite - It counts the number of White pixel in the grid box.
-    #                 NumOfBlack - It counts the number of Black pixel in the grid box.
-    # Description   : This method converts the image to thresholded grayscale.
-    # Return        : NumOfWhite, NumOfBlack
-    ################################################################################
-    def FindHistogram(self, i, j, HeightOfGrid, WidthOfGrid):
-        GridImage = self.ThreshImage[j:j+WidthOfGrid, i:i+HeightOfGrid]
-        Height, Width = GridImage.shape[:2]
-        NumOfWhite = NumOfBlack = 0
-
-        for i in range(Height):
-            for j in range(Width):
-                if GridImage[i, j] == 255:
-                    NumOfWhite += 1
-                else:
-                    NumOfBlack += 1
-
-        return NumOfWhite, NumOfBlack
+        self.GridBoxes = GridBoxes
 
     ################################################################################
     # Method        : MakeGrid_EvalHistogram
-    # Parameter     : Height, Width - These hold the height and width respectively
-    #                                 of complete answer image.
-    #                 WidthOfGrid - This contains the width of the grid box.
-    #                 HeightOfGrid - This contains the height of the grid box.
-    #                 RemainderOfWidth, RemainderOfHeight - As the exact value of
-    #                       height and width of grid box contains decimal value
-    #                       also but pixel position value cannot be decimal so
-    #                       these two variables contains the decimal value of
-    #                       width and height of grid respectively.
-    #                 WidthPixelSkipped, HeightPixelSkipped - These variables
-    #                       count the decimal value of pixels skipped due to
-    #                       integer value of pixel coordinate. When the become
-    #                       greater than 1, the pixel coordinate is increased
-    #                       by 1 to reduce error.
-    #                 HistMatrix_i, HistMatrix_j - These variables are used to
-    #                                              iterate over HistogramMatrix.
-    # Description   : This method makes grid on image and calls FindHistogram method 
-    #                 to find the histogram for the grid and saves its value in 
+    # Parameter     : Sheet - PreparedSheet of the OMR sheet image.
+    # Description   : This method makes grid on answer area(if not made already)
+    #                 and counts the number of black pixels of all the grid boxes
+    #                 at once from the integral image of sheet and saves them in
     #                 HistogramMatrix.
     # Return        : -
     ################################################################################
-    def MakeGrid_EvalHistogram(self):
-        ImageCopy = self.Image.copy()
-        ThreshImageCopy = self.ThreshImage.copy()
-
-        Height, Width = self.Image.shape[:2]
-        GridWidth = Width/self.NumOfCols
-        GridHeight = Height/self.NumOfRows
-        
-        i = 0
-        HistMatrix_i = 0
-        while i < Height:
-            j = 0
-            HistMatrix_j = 0
-            while j < Width:
-                #cv2.rectangle(ImageCopy, (int(j), int(i)), (int(j+GridWidth-1), int(i+GridHeight-1)), (0, 255, 0), 1)
-                #cv2.rectangle(ThreshImageCopy, (int(j), int(i)), (int(j+GridWidth-1), int(i+GridHeight-1)), (0, 255, 0), 1)
-                #cv2.imshow("GridImage", ImageCopy)
-                #cv2.imshow("ThreshImage", ThreshImageCopy)
-
-
-                NumOfWhite, NumOfBlack = self.FindHistogram(int(j), int(i), int(GridWidth-1), int(GridHeight-1))
-                self.HistogramMatrix[HistMatrix_i, HistMatrix_j] = NumOfBlack
-
-                HistMatrix_j += 1
-                
-                if HistMatrix_j >= self.NumOfCols:
-                    break
-
-                j += GridWidth
-                
-            HistMatrix_i += 1
-            if HistMatrix_i >= self.NumOfRows:
-                break
-
-            i += GridHeight
+    def MakeGrid_EvalHistogram(self, Sheet):
+        if self.GridBoxes is None:
+            self.GridBoxes = MakeGridBoxes(self.C_X, self.C_Y, self.Width, self.Length, self.NumOfRows,
+                                           self.NumOfCols, Sheet.Height, Sheet.Width)
+
+        self.HistogramMatrix = Sheet.CountBlack(*self.GridBoxes)
 
     ################################################################################
     # Method        : FindAnswerString
-    # Parameter     : MaxIndex - It is a array which stores the index corresponding
+    # Parameter     : Histogram - HistogramMatrix arranged such that each row of
+    #                             it corresponds to one character of answer.
+    #                 IsMarked - It tells which grid elements have enough black
+    #                            pixels to be considered as marked.
+    #                 MaxIndex - It is a array which stores the index corresponding
     #                            to the element containing maximum number of black
-    #                            pixel for each row/col.
-    #                 IndexOfMax & Max - These 2 are temporary variables for
-    #                                    finding MaxIndex.
-    #                 AnswerLength - This holds the total number of characters
-    #                                the answer is holding{Length of MaxIndex}.
+    #                            pixel for each row/col(-1 if none is marked).
     # Description   : This method finds element with maximum value in each row/col
     #                 and according to that appends the final answer string.
     # Return        : -
@@ -172,52 +240,40 @@ class FindAnswer:
     def FindAnswerString(self):
         # Finding max index for all col/row in HistMatrix
         if self.By_CorR == 'C':
-            MaxIndex = np.zeros(self.HistogramMatrix.shape[1], dtype=int)
-
-            for i in range(self.NumOfCols):
-                IndexOfMax = -1
-                Max = 0
-                for j in range(self.NumOfRows):
-                    if Max < self.HistogramMatrix[j, i] and self.HistogramMatrix[j, i] >= M.MIN_NUM_OF_BLACK_FOR_ANSWER:
-                        Max = self.HistogramMatrix[j, i]
-                        IndexOfMax = j
-                MaxIndex[i] = IndexOfMax
-
+            Histogram = self.HistogramMatrix.T
         elif self.By_CorR == 'R':
-            MaxIndex = np.zeros(self.HistogramMatrix.shape[0], dtype=int)
+            Histogram = self.HistogramMatrix
 
-            for i in range(self.NumOfRows):
-                IndexOfMax = -1
-                Max = 0
-                for j in range(self.NumOfCols):
-                    if Max < self.HistogramMatrix[i, j] and self.HistogramMatrix[i, j] >= M.MIN_NUM_OF_BLACK_FOR_ANSWER:
-                        Max = self.HistogramMatrix[i, j]
-                        IndexOfMax = j
-                MaxIndex[i] = IndexOfMax
+        # First element with maximum value is taken(if more than one have same value).
+        IsMarked = (Histogram >= M.MIN_NUM_OF_BLACK_FOR_ANSWER) & (Histogram > 0)
+        MaxIndex = np.argmax(np.where(IsMarked, Histogram, -1), axis=1)
+        MaxIndex[~IsMarked.any(axis=1)] = -1
 
         # Finding Answer from MaxIndex
-        AnswerLength = len(MaxIndex)        # Length of answer is equal to number of max index found
-
-        for i in range(AnswerLength):
+        for Index in MaxIndex:
             if self.Alp_or_Num == 0:                        # Alphabet if 0
-                self.AnswerString += M.Alphabet[MaxIndex[i] + self.StartFromIndex]
+                self.AnswerString += M.Alphabet[Index + self.StartFromIndex]
             elif self.Alp_or_Num == 1:                      # Number if 1
-                if MaxIndex[i] == -1:
+                if Index == -1:
                     self.AnswerString += '_'
                 else:    
-                    self.AnswerString += str(MaxIndex[i] + self.StartFromIndex)
+                    self.AnswerString += str(Index + self.StartFromIndex)
 
     ################################################################################
     # Method        : FindAnswer
-    # Parameter     : OMRImage - Contains the image of Cropped OMR provided.
+    # Parameter     : OMRImage - Contains the image of Cropped OMR provided or its
+    #                            PreparedSheet(to share it among all questions).
     # Description   : This method calls other suitable methods line wise to find the 
     #                 answer string of the question.
     # Return        : AnswerString
     ################################################################################
     def FindAnswer(self, OMRImage):
-        self.AnswerImage(OMRImage)
-        self.ThresholdImage()
-        self.MakeGrid_EvalHistogram()
+        if isinstance(OMRImage, PreparedSheet):
+            Sheet = OMRImage
+        else:
+            Sheet = PreparedSheet(OMRImage)
+
+        self.MakeGrid_EvalHistogram(Sheet)
         self.FindAnswerString()
 
         #cv2.waitKey(0)
@@ -0,0 +1,182 @@
+###############################################################################
+# File          : Pipeline.py
+# Created by    : Rahul Kedia
+# Created on    : 18/10/2026
+# Project       : ReadOMR
+# Description   : This file contains the streaming pipeline used to read large
+#                 batches of OMR sheets. Images are decoded, processed and
+#                 written by separate stages connected by bounded queues.
+################################################################################
+
+import os
+import queue
+import threading
+
+
+# Marks the end of the items in a queue.
+EndOfItems = object()
+
+
+################################################################################
+# Function      : ScanFolder
+# Parameter     : FolderPath - Path of the folder to be listed.
+# Description   : This function lists the folder lazily(one entry at a time)
+#                 so that very large folders are never held in memory.
+# Return        : Generator of names of the entries of the folder.
+################################################################################
+def ScanFolder(FolderPath):
+    with os.scandir(FolderPath) as Entries:
+        for Entry in Entries:
+            yield Entry.name
+
+
+################################################################################
+# Class         : StageError
+# Parameter     : Item - Item for which the stage failed.
+#                 Error - Exception raised by the stage.
+# Description   : Carries an exception from the decode/compute threads to the
+#                 writer, which raises it in the calling thread.
+# Return        : -
+################################################################################
+class StageError:
+    def __init__(self, Item, Error):
+        self.Item = Item
+        self.Error = Error
+
+
+################################################################################
+# Function      : RunPipeline
+# Parameter     : Items - Iterable(can be lazy) of items to be processed.
+#                 Decode - Function called with an item which reads it(e.g.
+#                          decodes the image).
+#                 Compute - Function called with the item and its decoded value
+#                           which returns the result.
+#                 Write - Function called with the item and its result. It is
+#                         called in the calling thread in the same order as
+#                         the items.
+#                 NumOfDecoders, NumOfWorkers - Number of threads of decode and
+#                                               compute stage.
+#                 QueueSize - Size of the queues between the stages.
+#                 Slots - Limits the number of items present in the pipeline at
+#                         once(decoded but not written). Decoders wait for a
+#                         free slot, so memory remains flat however large the
+#                         input is and however slow a stage is.
+#                 Pending - Results which came before the results of earlier
+#                           items and are waiting to be written in order.
+# Description   : This function runs the items through decode, compute and
+#                 write stages at the same time. Decode and compute stages run
+#                 in their own threads(OpenCV releases the GIL) and the stages
+#                 are connected by bounded queues which apply back-pressure.
+#                 An error raised by any stage(or by Items while listing them)
+#                 is raised in the calling thread after the results of the
+#                 items before it are written.
+# Return        : -
+################################################################################
+def RunPipeline(Items, Decode, Compute, Write, NumOfDecoders=1, NumOfWorkers=1, QueueSize=8):
+    DecodeQueue = queue.Queue(QueueSize)
+    ResultQueue = queue.Queue(QueueSize)
+    Slots = threading.Semaphore(2*QueueSize + NumOfWorkers)
+    Stop = threading.Event()
+
+    ItemsIterator = iter(Items)
+    ItemsLock = threading.Lock()
+    NextIndex = [0]
+    DecodersLeft = [NumOfDecoders]
+    ItemsIteratorFailed = [False]
+
+    def NextItem():
+        with ItemsLock:
+            Index = NextIndex[0]
+            NextIndex[0] += 1
+            if ItemsIteratorFailed[0]:
+                return Index, EndOfItems
+            try:
+                Item = next(ItemsIterator, EndOfItems)
+            except Exception as Error:
+                # Items cannot be listed further(e.g. folder not found), error is 
+                # written in place of the item and no more items are given.
+                Item = StageError(None, Error)
+                ItemsIteratorFailed[0] = True
+        return Index, Item
+
+    def Decoder():
+        try:
+            while not Stop.is_set():
+                Slots.acquire()
+                if Stop.is_set():
+                    break
+                Index, Item = NextItem()
+                if Item is EndOfItems:
+                    Slots.release()
+                    break
+                if isinstance(Item, StageError):
+                    DecodeQueue.put((Index, Item.Item, Item))
+                    break
+                try:
+                    Decoded = Decode(Item)
+                except Exception as Error:
+                    Decoded = StageError(Item, Error)
+                DecodeQueue.put((Index, Item, Decoded))
+        finally:
+            # Last decoder to finish tells all the workers that items are over.
+            with ItemsLock:
+                DecodersLeft[0] -= 1
+                IsLastDecoder = (DecodersLeft[0] == 0)
+            if IsLastDecoder:
+                for i in range(NumOfWorkers):
+                    DecodeQueue.put(EndOfItems)
+
+    def Worker():
+        while True:
+            Task = DecodeQueue.get()
+            if Task is EndOfItems:
+                ResultQueue.put(EndOfItems)
+                break
+            Index, Item, Decoded = Task
+            if isinstance(Decoded, StageError) or Stop.is_set():
+                Result = Decoded
+            else:
+                try:
+                    Result = Compute(Item, Decoded)
+                except Exception as Error:
+                    Result = StageError(Item, Error)
+            ResultQueue.put((Index, Item, Result))
+
+    Threads = [threading.Thread(target=Decoder, daemon=True) for i in range(NumOfDecoders)]
+    Threads += [threading.Thread(target=Worker, daemon=True) for i in range(NumOfWorkers)]
+    for Thread in Threads:
+        Thread.start()
+
+    # Writing results in the calling thread in the order of items.
+    Pending = {}
+    IndexToWrite = 0
+    WorkersLeft = NumOfWorkers
+    try:
+        while WorkersLeft > 0:
+            Task = ResultQueue.get()
+            if Task is EndOfItems:
+                WorkersLeft -= 1
+                continue
+            Pending[Task[0]] = Task
+
+            while IndexToWrite in Pending:
+                Index, Item, Result = Pending.pop(IndexToWrite)
+                if isinstance(Result, StageError):
+                    raise Result.Error
+                Write(Item, Result)
+                IndexToWrite += 1
+                Slots.release()
+    finally:
+        # On error, stop the stages and free them if they are waiting.
+        Stop.set()
+        while WorkersLeft > 0:
+            for i in range(NumOfDecoders):
+                Slots.release()
+            try:
+                if ResultQueue.get(timeout=0.1) is EndOfItems:
+                    WorkersLeft -= 1
+            except queue.Empty:
+                pass
+
+    for Thread in Threads:
+        Thread.join()
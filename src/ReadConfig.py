@@ -7,6 +7,33 @@
 ################################################################################
 
 # Simple and self explanatory code. documentation not done.
+#
+# The config file is compiled once into a CompiledLayout which also holds the
+# grid boxes of all the questions. The layout is saved next to the config
+# file as "<OMR_Name>_Config.npz"(grid boxes as arrays and rest of the layout
+# as JSON, nothing is unpickled while reading it) and is used again till the
+# config file is changed.
+
+import io
+import os
+import json
+import zipfile
+import hashlib
+import numpy as np
+import macros as M
+from GetAnswers import MakeGridBoxes
+
+
+# Increase this if CompiledLayout is changed, so that old saved layouts are compiled again.
+LAYOUT_VERSION = 1
+
+# Layouts already loaded in this process.
+LoadedLayouts = {}
+
+# Details of CompiledLayout(other than grid boxes) kept in the saved layout.
+SavedDetails = ("Version", "ExpandSideBy", "NumOfQuestion", "QuestionParam", "SheetSize",
+				"SourceMTime", "SourceSize", "SourceHash")
+
 
 def SortQuestionParam(ReadLines):
 	NumOfQ = len(ReadLines)
@@ -26,15 +53,7 @@ def SortQuestionParam(ReadLines):
 	return NumOfQ, QuestionParam
 
 
-def ReadConfig(OMR_Name):
-	global f
-	# Reading OMR Config file.
-	OMR_Path = "ConfigFiles/" + OMR_Name + "_Config.txt"
-	f = open(OMR_Path, "r")
-
-	# Reading all the lines
-	ReadLines = f.readlines()
-
+def ParseConfig(ReadLines):
 	# Extracting first line detail individually as it contains detail for expanding the side.
 	FirstLine = ReadLines[0]
 	FirstLine = FirstLine.replace("[", "").replace("]", "").replace("\n", "")\
@@ -46,3 +65,121 @@ def ReadConfig(OMR_Name):
 	NumOfQ, QuestionParam = SortQuestionParam(ReadLines[1:])
 
 	return ExpandSideBy, NumOfQ, QuestionParam
+
+
+################################################################################
+# Class         : CompiledLayout
+# Parameter     : ExpandSideBy, NumOfQuestion, QuestionParam - Same as read from
+#                                                              the config file.
+#                 SheetSize - Size of cropped OMR for which grid boxes are made.
+#                 GridBoxes - List of grid boxes(RowStarts, RowEnds, ColStarts,
+#                             ColEnds as arrays) of each question.
+#                 SourceMTime, SourceSize, SourceHash - Details of the config
+#                             file from which the layout is compiled.
+# Description   : Holds the parsed config file of a OMR along with the grid
+#                 boxes of all its questions.
+# Return        : -
+################################################################################
+class CompiledLayout:
+	def __init__(self, ReadLines, SourceStat, SourceHash):
+		self.Version = LAYOUT_VERSION
+		self.ExpandSideBy, self.NumOfQuestion, self.QuestionParam = ParseConfig(ReadLines)
+		self.SheetSize = tuple(M.RESIZE_TO)
+		self.GridBoxes = []
+		for Param in self.QuestionParam:
+			self.GridBoxes.append(MakeGridBoxes(Param[1], Param[2], Param[3], Param[4], Param[5], Param[6],
+												self.SheetSize[1], self.SheetSize[0]))
+
+		self.SourceMTime = SourceStat.st_mtime_ns
+		self.SourceSize = SourceStat.st_size
+		self.SourceHash = SourceHash
+
+	def IsCompiledFrom(self, SourceStat):
+		return (self.SourceMTime == SourceStat.st_mtime_ns and self.SourceSize == SourceStat.st_size)
+
+	def IsUsable(self):
+		return (self.Version == LAYOUT_VERSION and self.SheetSize == tuple(M.RESIZE_TO))
+
+
+def ReadSavedLayout(LayoutPath):
+	try:
+		with np.load(LayoutPath, allow_pickle=False) as SavedLayout:
+			Details = json.loads(str(SavedLayout["Details"]))
+			GridBoxes = [tuple(SavedLayout["GridBoxes_{}_{}".format(i, j)] for j in range(4))
+						 for i in range(Details["NumOfQuestion"])]
+	except (OSError, ValueError, KeyError, TypeError, EOFError, zipfile.BadZipFile):
+		return None
+
+	# Making the layout from the saved details without compiling the config file again.
+	Layout = CompiledLayout.__new__(CompiledLayout)
+	for Name in SavedDetails:
+		setattr(Layout, Name, Details.get(Name))
+	Layout.SheetSize = tuple(Layout.SheetSize or ())
+	Layout.GridBoxes = GridBoxes
+
+	if Layout.IsUsable():
+		return Layout
+	return None
+
+
+def SaveLayout(Layout, LayoutPath):
+	# Writing to a temporary file first so that other processes never read half written layout.
+	TempPath = "{}.{}.tmp".format(LayoutPath, os.getpid())
+	try:
+		Details = {Name: getattr(Layout, Name) for Name in SavedDetails}
+		Details["SheetSize"] = list(Layout.SheetSize)
+		GridBoxes = {"GridBoxes_{}_{}".format(i, j): Array
+					 for i, Boxes in enumerate(Layout.GridBoxes) for j, Array in enumerate(Boxes)}
+		with open(TempPath, "wb") as f:
+			np.savez(f, Details=np.array(json.dumps(Details)), **GridBoxes)
+		os.replace(TempPath, LayoutPath)
+	except OSError:
+		# Layout is only a cache, so not being able to save it is not an error.
+		if os.path.exists(TempPath):
+			os.remove(TempPath)
+
+
+################################################################################
+# Function      : LoadLayout
+# Parameter     : OMR_Name - It is the name of omr type.
+# Description   : This function returns the compiled layout of the OMR. It is
+#                 taken from the layouts already loaded or else from the saved
+#                 layout file if the config file is not changed(checked by
+#                 modification time and size and then by hash of its contents),
+#                 or else the config file is compiled again and saved.
+# Return        : Layout
+################################################################################
+def LoadLayout(OMR_Name):
+	OMR_Path = "ConfigFiles/" + OMR_Name + "_Config.txt"
+	LayoutPath = "ConfigFiles/" + OMR_Name + "_Config.npz"
+	SourceStat = os.stat(OMR_Path)
+
+	Layout = LoadedLayouts.get(OMR_Name)
+	if Layout is not None and Layout.IsCompiledFrom(SourceStat) and Layout.IsUsable():
+		return Layout
+
+	Layout = ReadSavedLayout(LayoutPath)
+	if Layout is None or not Layout.IsCompiledFrom(SourceStat):
+		with open(OMR_Path, "rb") as f:
+			Contents = f.read()
+		SourceHash = hashlib.sha1(Contents).hexdigest()
+
+		if Layout is not None and Layout.SourceHash == SourceHash:
+			# Only modification time is changed(file touched or copied).
+			Layout.SourceMTime = SourceStat.st_mtime_ns
+			Layout.SourceSize = SourceStat.st_size
+		else:
+			ReadLines = io.TextIOWrapper(io.BytesIO(Contents)).readlines()
+			Layout = CompiledLayout(ReadLines, SourceStat, SourceHash)
+
+		SaveLayout(Layout, LayoutPath)
+
+	LoadedLayouts[OMR_Name] = Layout
+
+	return Layout
+
+
+def ReadConfig(OMR_Name):
+	Layout = LoadLayout(OMR_Name)
+
+	return list(Layout.ExpandSideBy), Layout.NumOfQuestion, Layout.QuestionParam
@@ -0,0 +1,192 @@
+###############################################################################
+# File          : ResultCache.py
+# Created by    : Rahul Kedia
+# Created on    : 18/10/2026
+# Project       : ReadOMR
+# Description   : This file contains the on-disk cache of answers of OMR sheets
+#                 addressed by the contents of the image, so that a sheet which
+#                 is read again(rescanned copy, re-uploaded or re-run) is not
+#                 cropped and read again.
+################################################################################
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import time
+
+
+# Part of MaxSize a cache may add before the size is counted again from the folder. Other
+# workers(processes) add to the same folder, so the folder can cross MaxSize by at most this 
+# much per worker.
+RecountAfter = 0.05
+
+# Temp files older than this(seconds) are left by a worker which died while storing.
+StaleTempFileAge = 3600
+
+
+# Macros which change only how the sheets are run(not their answers).
+MacrosNotAffectingAnswers = {"NUM_OF_WORKERS", "CHUNK_SIZE", "THREAD_OR_PROCESS_WORKERS",
+                             "OPENCV_THREADS_PER_WORKER", "STREAMING_PIPELINE", "NUM_OF_DECODERS",
+                             "PIPELINE_QUEUE_SIZE", "RESULTS_FORMAT", "RESULTS_FLUSH_EVERY",
+                             "RESUME_BATCHES", "RESULT_CACHE", "RESULT_CACHE_FOLDER",
+                             "RESULT_CACHE_MAX_SIZE"}
+
+
+################################################################################
+# Function      : HashMacros
+# Parameter     : Macros - macros module.
+#                 Values - Values of the macros which may change the answers.
+# Description   : This function finds the hash of the values of macros so that
+#                 answers found with different macros are not mixed.
+# Return        : Hash(hex string)
+################################################################################
+def HashMacros(Macros):
+    Values = {}
+    for Name, Value in vars(Macros).items():
+        if Name.startswith("_") or Name in MacrosNotAffectingAnswers:
+            continue
+        if isinstance(Value, (bool, int, float, str, tuple, list)):
+            Values[Name] = Value
+
+    return hashlib.sha1(repr(sorted(Values.items())).encode()).hexdigest()
+
+
+################################################################################
+# Class         : ResultCache
+# Parameter     : FolderPath - Folder in which the answers are stored, one file
+#                              for each sheet named by its key.
+#                 MaxSize - Maximum total size(bytes) of the stored answers.
+#                           Least recently used answers are removed when it is
+#                           crossed.
+#                 Context - Hash of everything other than the image which the
+#                           answers depend on(compiled layout and macros).
+#                 TotalSize - Total size of the stored answers.
+#                 AddedSinceCount - Size added by this cache since TotalSize was
+#                                   last counted from the folder.
+# Description   : Stores the answer dictionaries of sheets on disk. Time of
+#                 last use of an answer is kept as modification time of its
+#                 file. It can be shared by the threads of a batch, and the
+#                 worker processes sharing the folder count its size again
+#                 from the folder often so that it remains bounded.
+# Return        : -
+################################################################################
+class ResultCache:
+    def __init__(self, FolderPath, MaxSize, Context):
+        self.FolderPath = FolderPath
+        self.MaxSize = MaxSize
+        self.Context = Context
+        self.Lock = threading.Lock()
+
+        os.makedirs(FolderPath, exist_ok=True)
+        self.TotalSize = sum(Size for Time, Size, Path in self.ListEntries())
+        self.AddedSinceCount = 0
+
+    ################################################################################
+    # Method        : ListEntries
+    # Parameter     : StaleTime - Temp files modified before this are removed.
+    # Description   : This method lists the stored answers. Temp files left by
+    #                 a worker which died while storing are removed.
+    # Return        : List of (modification time, size, path) of stored answers.
+    ################################################################################
+    def ListEntries(self):
+        Entries = []
+        StaleTime = time.time() - StaleTempFileAge
+        with os.scandir(self.FolderPath) as Files:
+            for File in Files:
+                try:
+                    if File.name.endswith(".json"):
+                        Stat = File.stat()
+                        Entries.append((Stat.st_mtime_ns, Stat.st_size, File.path))
+                    elif File.name.endswith(".tmp") and File.stat().st_mtime < StaleTime:
+                        os.remove(File.path)
+                except FileNotFoundError:               # Removed by another worker
+                    continue
+
+        return Entries
+
+    ################################################################################
+    # Method        : MakeKey
+    # Parameter     : ImageBytes - Contents of the image file of OMR sheet.
+    #                 UpperLimitOfValue - Upper limit of "Value" for masking if
+    #                                     calibrated for the batch else None.
+    # Description   : This method finds the key of the sheet from the hash of the
+    #                 image and the context.
+    # Return        : Key
+    ################################################################################
+    def MakeKey(self, ImageBytes, UpperLimitOfValue=None):
+        Hash = hashlib.sha1(ImageBytes)
+        Hash.update("{}|{}".format(self.Context, UpperLimitOfValue).encode())
+
+        return Hash.hexdigest()
+
+    ################################################################################
+    # Method        : Get
+    # Parameter     : Key - Key of the sheet(from MakeKey).
+    # Description   : This method finds the stored answers of the sheet and marks
+    #                 them as used now.
+    # Return        : AnswerDict or None if not stored.
+    ################################################################################
+    def Get(self, Key):
+        Path = os.path.join(self.FolderPath, Key + ".json")
+        try:
+            with open(Path) as File:
+                AnswerDict = json.load(File)
+            os.utime(Path)
+        except (OSError, ValueError):
+            return None
+
+        return AnswerDict
+
+    ################################################################################
+    # Method        : Put
+    # Parameter     : Key - Key of the sheet(from MakeKey).
+    #                 AnswerDict - It is the answer dictionary for the questions.
+    # Description   : This method stores the answers of the sheet. The file is
+    #                 written completely first and then renamed so that a partly
+    #                 written file is never read.
+    # Return        : -
+    ################################################################################
+    def Put(self, Key, AnswerDict):
+        Contents = json.dumps(AnswerDict).encode()
+
+        FileDescriptor, TempPath = tempfile.mkstemp(suffix=".tmp", dir=self.FolderPath)
+        with os.fdopen(FileDescriptor, "wb") as File:
+            File.write(Contents)
+        os.replace(TempPath, os.path.join(self.FolderPath, Key + ".json"))
+
+        with self.Lock:
+            self.TotalSize += len(Contents)
+            self.AddedSinceCount += len(Contents)
+            if self.TotalSize > self.MaxSize or self.AddedSinceCount > RecountAfter * self.MaxSize:
+                self.Evict()
+
+    ################################################################################
+    # Method        : Evict
+    # Parameter     : LowerSize - Size till which the answers are removed, kept
+    #                             below MaxSize so that eviction is not needed
+    #                             for every new sheet.
+    # Description   : This method counts the total size again from the folder(as
+    #                 other workers may also use it) and if it is above MaxSize,
+    #                 removes the least recently used answers till the total 
+    #                 size is below LowerSize.
+    # Return        : -
+    ################################################################################
+    def Evict(self):
+        LowerSize = 0.9 * self.MaxSize
+
+        Entries = sorted(self.ListEntries())
+        self.TotalSize = sum(Size for Time, Size, Path in Entries)
+        self.AddedSinceCount = 0
+        if self.TotalSize <= self.MaxSize:
+            return
+
+        for Time, Size, Path in Entries:
+            if self.TotalSize <= LowerSize:
+                break
+            try:
+                os.remove(Path)
+            except FileNotFoundError:
+                pass
+            self.TotalSize -= Size
@@ -0,0 +1,259 @@
+###############################################################################
+# File          : ResultsWriter.py
+# Created by    : Rahul Kedia
+# Created on    : 18/10/2026
+# Project       : ReadOMR
+# Description   : This file contains the writer which stores the answers of a
+#                 batch of OMR sheets in the answers file as text, JSON Lines
+#                 or CSV.
+################################################################################
+
+import os
+import csv
+import json
+import shutil
+
+
+# Extension of the answers file for each format.
+Extensions = {"txt": ".txt", "jsonl": ".jsonl", "csv": ".csv"}
+
+
+################################################################################
+# Class         : ResultsWriter
+# Parameter     : FilePath - Path of the answers file.
+#                 Format - "txt"(readable text), "jsonl"(one JSON object per
+#                          sheet) or "csv"(one row per sheet, one column per
+#                          question).
+#                 Append - Flag for keeping the answers already present in the
+#                          file(else a new file is made).
+#                 FlushEvery - Number of sheets after which the answers are
+#                              flushed to the disk.
+#                 Resume - Flag for keeping the progress of the batch in the
+#                          manifest so that a batch which died halfway is
+#                          continued(finished sheets are skipped) when it is
+#                          run again.
+#                 InputFolderPath - Folder of the images of the batch. Batch is
+#                                   continued only if it is the same folder as
+#                                   recorded in the manifest, else started
+#                                   again.
+#                 TempFilePath - Answers of the batch are written here and it
+#                                is renamed to FilePath when the batch is
+#                                complete, so FilePath always has complete
+#                                batches only.
+#                 File - Only handle of the answers(temp) file kept open for
+#                        the complete batch.
+#                 Header - Names of the questions(columns of CSV).
+#                 ManifestPath - Manifest of the progress of the batch. Its first
+#                                line has the input folder and then it has a
+#                                line for each finished sheet with its path,
+#                                size and modification time and the size of
+#                                the temp file after its answers are written.
+#                                Paths are kept resolved(os.path.realpath) so
+#                                that the same folder written differently is
+#                                still matched.
+#                 FinishedSheets - Path: (Size, Mtime) of sheets finished
+#                                  before the batch was continued.
+#                 Unrecorded - Sheets written but not yet in the manifest.
+# Description   : Writes the answers of the sheets of a batch one by one. It is
+#                 used as a context manager, on leaving the block the batch is
+#                 completed(Close) or discarded if an error occured(Abort).
+#                 While resuming, the temp file is cut at the size recorded for
+#                 the last sheet in the manifest(answers written after it are
+#                 partial) and the batch continues from there.
+# Return        : -
+################################################################################
+class ResultsWriter:
+    def __init__(self, FilePath, Format="txt", Append=False, FlushEvery=1, Resume=False, InputFolderPath=None):
+        if Format not in Extensions:
+            raise ValueError("Unknown format of answers file: {}".format(Format))
+
+        self.FilePath = FilePath
+        self.Format = Format
+        self.FlushEvery = max(1, FlushEvery)
+        self.Resume = Resume
+        self.InputFolderPath = None if InputFolderPath is None else os.path.realpath(InputFolderPath)
+        self.TempFilePath = FilePath + ".tmp"
+        self.ManifestPath = FilePath + ".progress"
+        self.NumOfUnflushed = 0
+        self.Header = None
+        self.FinishedSheets = {}
+        self.Unrecorded = []
+
+        ResultsSize = None
+        if Resume and os.path.isfile(self.TempFilePath) and os.path.isfile(self.ManifestPath):
+            ResultsSize = self.ReadManifest()
+
+        if ResultsSize is not None:
+            # Continuing the batch which died halfway(in whichever mode it was started).
+            with open(self.TempFilePath, "r+b") as TempFile:
+                TempFile.truncate(ResultsSize)
+            HeaderFilePath = self.TempFilePath
+            HasOldAnswers = ResultsSize > 0
+        else:
+            # Answers already present are copied first so that the complete file is renamed.
+            HeaderFilePath = FilePath
+            HasOldAnswers = Append and os.path.isfile(FilePath) and os.path.getsize(FilePath) > 0
+            if HasOldAnswers:
+                shutil.copyfile(FilePath, self.TempFilePath)
+        self.File = open(self.TempFilePath, "a" if HasOldAnswers else "w", newline="")
+
+        if Resume:
+            self.Manifest = open(self.ManifestPath, "a" if ResultsSize is not None else "w")
+            # Recording the input folder and the answers copied from answers file(if any) as 
+            # the start of the batch.
+            if ResultsSize is None:
+                self.Manifest.write(json.dumps({"InputFolderPath": self.InputFolderPath}) + "\n")
+                self.Flush()
+
+        if Format == "csv":
+            self.CSVWriter = csv.writer(self.File)
+            if HasOldAnswers:
+                with open(HeaderFilePath, newline="") as OldFile:
+                    self.Header = next(csv.reader(OldFile))[1:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ExceptionType, ExceptionValue, Traceback):
+        if ExceptionType is None:
+            self.Close()
+        else:
+            self.Abort()
+
+    ################################################################################
+    # Method        : ReadManifest
+    # Parameter     : Record - Line of the manifest for a finished sheet.
+    # Description   : This method reads the sheets finished by the batch which is
+    #                 being continued. A line cut by the crash is ignored.
+    # Return        : Size of the temp file after the last finished sheet or None
+    #                 if the batch cannot be continued(nothing recorded, other
+    #                 input folder or temp file not matching the manifest).
+    ################################################################################
+    def ReadManifest(self):
+        ResultsSize = None
+        ManifestFolderPath = None
+        with open(self.ManifestPath) as Manifest:
+            for Line in Manifest:
+                try:
+                    Record = json.loads(Line)
+                except ValueError:
+                    break
+                if "InputFolderPath" in Record:
+                    ManifestFolderPath = Record["InputFolderPath"]
+                    continue
+                if Record.get("ImagePath") is not None:
+                    self.FinishedSheets[Record["ImagePath"]] = (Record["Size"], Record["Mtime"])
+                ResultsSize = Record["ResultsSize"]
+
+        # Batch is started again if it cannot be continued.
+        if (ResultsSize is None or ManifestFolderPath != self.InputFolderPath or 
+            os.path.getsize(self.TempFilePath) < ResultsSize):
+            self.FinishedSheets = {}
+            return None
+
+        return ResultsSize
+
+    ################################################################################
+    # Method        : IsFinished
+    # Parameter     : ImagePath - Path of the image of OMR sheet.
+    # Description   : This method checks if the sheet was finished before the
+    #                 batch was continued(and is not changed since).
+    # Return        : True or False
+    ################################################################################
+    def IsFinished(self, ImagePath):
+        ImagePath = os.path.realpath(ImagePath)
+        if ImagePath not in self.FinishedSheets:
+            return False
+
+        Stat = os.stat(ImagePath)
+        return self.FinishedSheets[ImagePath] == (Stat.st_size, Stat.st_mtime_ns)
+
+    ################################################################################
+    # Method        : Write
+    # Parameter     : ImageName - Name of the image of OMR sheet.
+    #                 AnswerDict - It is the answer dictionary for the questions.
+    #                 ImagePath - Path of the image(recorded in the manifest).
+    # Description   : This method writes the answers of one sheet. They reach the
+    #                 disk every FlushEvery sheets.
+    # Return        : -
+    ################################################################################
+    def Write(self, ImageName, AnswerDict, ImagePath=None):
+        if self.Format == "txt":
+            self.File.write("\nAnswers to: {} :- \n".format(ImageName))
+            for Question, Answer in AnswerDict.items():
+                self.File.write("{}\t\t\t: {}\n".format(Question, Answer))
+
+        elif self.Format == "jsonl":
+            self.File.write(json.dumps({"ImageName": ImageName, "Answers": AnswerDict}) + "\n")
+
+        elif self.Format == "csv":
+            if self.Header is None:
+                self.Header = list(AnswerDict.keys())
+                self.CSVWriter.writerow(["ImageName"] + self.Header)
+            self.CSVWriter.writerow([ImageName] + [AnswerDict.get(Question, "") for Question in self.Header])
+
+        if self.Resume:
+            self.Unrecorded.append(None if ImagePath is None else os.path.realpath(ImagePath))
+
+        self.NumOfUnflushed += 1
+        if self.NumOfUnflushed >= self.FlushEvery:
+            self.Flush()
+
+    ################################################################################
+    # Method        : Flush
+    # Description   : This method flushes the answers to the disk. If resuming is
+    #                 asked, the sheets are recorded in the manifest only after
+    #                 their answers are surely on the disk.
+    # Return        : -
+    ################################################################################
+    def Flush(self):
+        self.File.flush()
+        self.NumOfUnflushed = 0
+
+        if self.Resume:
+            os.fsync(self.File.fileno())
+            ResultsSize = os.fstat(self.File.fileno()).st_size
+            # Size of temp file is recorded even if no sheet is written.
+            Records = []
+            for ImagePath in (self.Unrecorded if len(self.Unrecorded) > 0 else [None]):
+                Size, Mtime = None, None
+                if ImagePath is not None:
+                    Stat = os.stat(ImagePath)
+                    Size, Mtime = Stat.st_size, Stat.st_mtime_ns
+                Records.append({"ImagePath": ImagePath, "Size": Size, "Mtime": Mtime, "ResultsSize": ResultsSize})
+            self.Manifest.write("".join(json.dumps(Record) + "\n" for Record in Records))
+            self.Manifest.flush()
+            self.Unrecorded = []
+
+    ################################################################################
+    # Method        : Close
+    # Description   : This method completes the batch. The temp file is written
+    #                 to the disk and renamed to the answers file at once.
+    # Return        : -
+    ################################################################################
+    def Close(self):
+        self.Flush()
+        os.fsync(self.File.fileno())
+        self.File.close()
+        os.replace(self.TempFilePath, self.FilePath)
+
+        if self.Resume:
+            self.Manifest.close()
+            os.remove(self.ManifestPath)
+
+    ################################################################################
+    # Method        : Abort
+    # Description   : This method discards the batch. Answers file is left as it
+    #                 was before the batch. If resuming is asked, the progress is
+    #                 kept instead so that the batch can be continued.
+    # Return        : -
+    ################################################################################
+    def Abort(self):
+        if self.Resume:
+            self.Flush()
+            self.File.close()
+            self.Manifest.close()
+            return
+
+        self.File.close()
+        os.remove(self.TempFilePath)
@@ -14,6 +14,11 @@
 # Resize image to this length every time in the code to get uniform output.
 RESIZE_TO = (750, 950)
 
+# Decode JPEG input images directly at reduced size(1/2, 1/4 or 1/8, largest reduction still
+# not smaller than RESIZE_TO) before resizing them or decode them at full size. Reduced size is
+# faster but lossy, faintly marked answers may be missed.
+REDUCED_DECODE = 0                          # 0 for full size and 1 for reduced size
+
 # Minimum score required for a box to be considered as guiding box.
 MIN_SCORE_REQ = 8
 
@@ -22,7 +27,36 @@ MIN_CONTOUR_AREA = 12
 MAX_CONTOUR_AREA = 500
 
 # Run code with the use of template logic or with contour logic.
-TEMPLATE_OR_CONTOUR_LOGIC = 1               # 0 for templatelogic and 1 for contour logic
+TEMPLATE_OR_CONTOUR_LOGIC = 1               # 0 for templatelogic, 1 for contour logic and 2 for connected components logic
+
+# Find guiding boxes only in left and right margin strips of the image or in the complete image.
+DETECT_IN_MARGIN_STRIPS = 0                 # 0 for complete image and 1 for margin strips
+
+# Width of each margin strip as a fraction of width of image.
+# (Complete image is used if less than THRESHOLD_TO_CHECK_IF_CORNER_BOX boxes are found in a strip,
+# if a box touches the inner edge of a strip(it may be cut by it) or if number of left and right
+# guiding boxes found in the strips is not equal.)
+MARGIN_STRIP_WIDTH_RATIO = 0.2
+
+# Reuse the corner guiding boxes of the previous sheet(e.g. sheets from a sheet fed scanner) if
+# they are found again near their previous position, else find guiding boxes in complete image.
+REUSE_PREVIOUS_GUIDING_BOXES = 0            # 0 for finding every time and 1 for reusing
+
+# Distance(in pixels) around previous corner guiding box in which it is searched again.
+TRACK_SEARCH_MARGIN = 6
+
+# Maximum change(in pixels) in width and height of corner guiding box found again.
+TRACK_SIZE_TOLERANCE = 2
+
+# Find candidate guiding boxes at reduced resolution(half for 1, quarter for 2) and refine only
+# them at full resolution, or find boxes at full resolution with TEMPLATE_OR_CONTOUR_LOGIC.
+# At RESIZE_TO of 750x950 use at most 1, at quarter resolution the gaps between adjacent
+# guiding boxes vanish and they are missed.
+PYRAMID_LEVELS = 0                          # 0 for full resolution
+
+# Size of kernel used to close small gaps in white patches before labelling them in connected components logic.
+# (Boxes found are same as contour logic for separate patches, patches closer than this are joined.)
+CC_MORPH_KERNEL_SIZE = 3                    # 1 for no closing
 
 # Run code with Inside line logic, or score logic or ransac logic.
 INSIDELINE_OR_SCORE_OR_RANSAC_LOGIC = 3     # 1 for inside line logic and 2 for score logic and 3 for ransac logic
@@ -35,6 +69,20 @@ MAX_INLIER_DIST = 5
 # A box is corner box if the number of boxes in the verticle line of BoxToCheck is greater than this threshold or not.
 THRESHOLD_TO_CHECK_IF_CORNER_BOX = 10
 
+# Warp the cropped OMR directly to RESIZE_TO size(resize folded in the projective transform)
+# or warp it at size of input image and then resize it.
+CROP_WARP_TO_OUTPUT_SIZE = 1                # 0 for warp and resize and 1 for one warp
+
+# Warp only the gray plane of OMR(all that is needed for finding answers) or all 3 channels.
+CROP_GRAY_ONLY = 0                          # 0 for all channels and 1 for gray only
+
+# Split the input image into its "Value" plane(for finding guiding boxes) and gray plane(for
+# brightness, cropping and answers) once on reading or carry the BGR image.
+SINGLE_CHANNEL_PLANES = 0                   # 0 for BGR image and 1 for planes
+
+# Sample only the regions of questions from input image or crop(warp) the complete OMR sheet.
+SPARSE_ANSWER_SAMPLING = 0                  # 0 for complete sheet and 1 for regions of questions
+
 # Minimum number of black pixel present in grid element for considering as marked.
 MIN_NUM_OF_BLACK_FOR_ANSWER = 10
 
@@ -47,6 +95,55 @@ dp = 1.3
 MinRadius = 0
 MaxRadius = 20
 
+# Brightness of image is checked only on every BRIGHTNESS_SAMPLE_STEP'th row and column.
+BRIGHTNESS_SAMPLE_STEP = 1                  # 1 for checking all the pixels
+
+# Check brightness of every sheet or calibrate it once for the complete batch of sheets.
+BRIGHTNESS_PER_BATCH = 0                    # 0 for every sheet and 1 for once per batch
+
+# Number of sheets used to calibrate brightness when it is checked once per batch.
+BRIGHTNESS_CALIBRATION_SHEETS = 5
+
+# Number of worker processes used to read the sheets of a batch in parallel.
+NUM_OF_WORKERS = 1                          # 1 for reading sheets one by one
+
+# Read sheets in parallel with threads or with processes(when NUM_OF_WORKERS is more than 1).
+THREAD_OR_PROCESS_WORKERS = 1               # 0 for thread pool and 1 for process pool
+
+# Number of sheets sent to a worker process at once.
+CHUNK_SIZE = 4
+
+# Number of threads OpenCV can use inside each worker process(so that workers do not oversubscribe cores).
+OPENCV_THREADS_PER_WORKER = 1
+
+# Read sheets with the streaming pipeline(decode, find answers and store stages running together).
+STREAMING_PIPELINE = 0                      # 0 for listing all sheets first and 1 for streaming pipeline
+
+# Number of threads decoding the images in the streaming pipeline(NUM_OF_WORKERS threads find the answers).
+NUM_OF_DECODERS = 1
+
+# Size of the queues between the stages of the streaming pipeline.
+PIPELINE_QUEUE_SIZE = 8
+
+# Format of the answers file.
+RESULTS_FORMAT = "txt"                      # "txt" for text, "jsonl" for JSON Lines and "csv" for CSV
+
+# Number of sheets after which the answers are flushed to the answers file.
+RESULTS_FLUSH_EVERY = 32
+
+# Keep the progress of the batch in a manifest so that a batch which died halfway continues from
+# where it stopped(finished sheets are skipped) when run again, or start every batch again.
+RESUME_BATCHES = 0                          # 0 for start again and 1 for continue
+
+# Keep the answers of sheets on disk(by hash of image, layout and macros) so that a sheet read
+# again is not cropped and read again. Not used with REUSE_PREVIOUS_GUIDING_BOXES.
+RESULT_CACHE = 0                            # 0 for no cache and 1 for cache
+
+# Folder of the cache of answers and the maximum size(bytes) of answers kept in it(least recently 
+# used are removed).
+RESULT_CACHE_FOLDER = "ResultCache"
+RESULT_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
 # Threshold Image at this value:
 ThresholdImageAt = 75
 
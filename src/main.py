@@ -7,33 +7,390 @@
 ################################################################################
 
 import cv2
+import numpy as np
 import os
+import multiprocessing
+import threading
+import concurrent.futures
+from itertools import repeat, islice
 import macros as M
 import GetAnswers as GA
-from CropOMR import CropOMR
-from ReadConfig import ReadConfig
-import json
+from CropOMR import CropOMR, CropState, FindCropMatrix
+from ReadConfig import LoadLayout
+from CheckBrightness import CalibrateBrightness
+from FindBoundingBoxes import FindValuePlane
+from Pipeline import RunPipeline, ScanFolder
+from ResultsWriter import ResultsWriter, Extensions
+from ResultCache import ResultCache, HashMacros
+
+
+# Flags for decoding the image at 1/ReduceBy of its size.
+ReducedDecodeFlags = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                      (2, cv2.IMREAD_REDUCED_COLOR_2)]
 
 
 ################################################################################
-# Function      : StoreInJSON
-# Parameter     : AnswerDict - It is the answer dictionary for the questions.
-# Description   : This function stores the answers in a json file named
-#                 "Answers.txt"
+# Function      : ReadJPEGSize
+# Parameter     : ImagePath - Path of the image.
+#                 Marker - Marker of the segment of the JPEG file.
+# Description   : This function reads the size of a JPEG image from its header
+#                 (start of frame segment) without decoding the image.
+# Return        : (Width, Height) or None if the image is not a JPEG image.
+################################################################################
+def ReadJPEGSize(ImagePath):
+    with open(ImagePath, "rb") as File:
+        if File.read(2) != b"\xff\xd8":
+            return None
+
+        while True:
+            Byte = File.read(1)
+            if Byte != b"\xff":
+                return None
+            Marker = File.read(1)
+            while Marker == b"\xff":           # Fill bytes
+                Marker = File.read(1)
+            if not Marker:
+                return None
+            Marker = Marker[0]
+
+            # Markers without segment.
+            if Marker == 0x01 or 0xd0 <= Marker <= 0xd7:
+                continue
+
+            Length = int.from_bytes(File.read(2), "big")
+            # Start of frame markers(except DHT, JPG and DAC).
+            if 0xc0 <= Marker <= 0xcf and Marker not in (0xc4, 0xc8, 0xcc):
+                Segment = File.read(5)
+                if len(Segment) < 5:
+                    return None
+                return (int.from_bytes(Segment[3:5], "big"), int.from_bytes(Segment[1:3], "big"))
+            if Marker in (0xd9, 0xda) or Length < 2:
+                return None
+            File.seek(Length - 2, 1)
+
+
+################################################################################
+# Function      : FindDecodeFlag
+# Parameter     : ImagePath - Path of the input image of OMR sheet.
+# Description   : This function finds the flag for decoding the image at the
+#                 smallest reduced size(1/2, 1/4 or 1/8, scaled while decoding)
+#                 which is still not smaller than RESIZE_TO. Sides are compared
+#                 irrespective of orientation as the image may be rotated while
+#                 decoding.
+# Return        : Flag for cv2.imread
+################################################################################
+def FindDecodeFlag(ImagePath):
+    if not M.REDUCED_DECODE:
+        return cv2.IMREAD_COLOR
+
+    Size = ReadJPEGSize(ImagePath)
+    if Size is None:
+        return cv2.IMREAD_COLOR
+
+    for ReduceBy, Flag in ReducedDecodeFlags:
+        if min(Size) // ReduceBy >= min(M.RESIZE_TO) and max(Size) // ReduceBy >= max(M.RESIZE_TO):
+            return Flag
+
+    return cv2.IMREAD_COLOR
+
+
+################################################################################
+# Class         : InputPlanes
+# Parameter     : InputImage - BGR input image of OMR sheet.
+#                 ValueImage - "Value" plane(max of B, G and R) used for finding
+#                              guiding boxes.
+#                 GrayImage - Gray plane used for brightness, cropping and
+#                             answers.
+# Description   : Holds the single channel planes of the input image, which are
+#                 found once on reading so that the BGR image is not carried and
+#                 converted again and again.
 # Return        : -
 ################################################################################
-def StoreInJSON(AnswerDict, OMR_Name, ImageName, CreateNewFile, FirstFile):
-    AnswersFolderPath = os.path.abspath(os.path.join('Answers'))
+class InputPlanes:
+    def __init__(self, InputImage):
+        self.ValueImage = FindValuePlane(InputImage)
+        self.GrayImage = cv2.cvtColor(InputImage, cv2.COLOR_BGR2GRAY)
+
+
+################################################################################
+# Function      : ReadInputImage
+# Parameter     : ImagePath - Path of the input image of OMR sheet.
+#                 ImageBytes - Contents of the image file if already read.
+# Description   : This function reads the input image(at reduced size if it is
+#                 much larger than RESIZE_TO) and resizes it. It is split into
+#                 InputPlanes if M.SINGLE_CHANNEL_PLANES is set.
+# Return        : InputImage(or its InputPlanes)
+################################################################################
+def ReadInputImage(ImagePath, ImageBytes=None):
+    if ImageBytes is None:
+        InputImage = cv2.imread(ImagePath, FindDecodeFlag(ImagePath))
+    else:
+        InputImage = cv2.imdecode(np.frombuffer(ImageBytes, dtype=np.uint8), FindDecodeFlag(ImagePath))
+    InputImage = cv2.resize(InputImage, M.RESIZE_TO)
+
+    if M.SINGLE_CHANNEL_PLANES == 1:
+        return InputPlanes(InputImage)
+
+    return InputImage
+
 
-    AnswersFilePath = AnswersFolderPath + "/" + OMR_Name + "_Answers.txt"
-    if CreateNewFile and FirstFile:
-        f = open(AnswersFilePath, 'w')
+################################################################################
+# Function      : CalibrateBrightnessForBatch
+# Parameter     : ImageNames - Names of all the images of the batch.
+# Description   : This function reads first few images of the batch and finds
+#                 the upper limit of "Value" once for the complete batch.
+# Return        : UpperLimitOfValue
+################################################################################
+def CalibrateBrightnessForBatch(InputImageFolderPath, ImageNames):
+    Images = []
+    for ImageName in ImageNames[:M.BRIGHTNESS_CALIBRATION_SHEETS]:
+        InputImage = ReadInputImage(InputImageFolderPath + "/" + ImageName)
+        if isinstance(InputImage, InputPlanes):
+            InputImage = InputImage.GrayImage
+        Images.append(InputImage)
+
+    return CalibrateBrightness(Images)
+
+
+################################################################################
+# Function      : GetCropState
+# Parameter     : CropStates - threading.local holding the CropState of each
+#                              thread reading the sheets of a batch.
+# Description   : This function gives the CropState of the calling thread, which
+#                 is kept from one sheet to the next so that corners of the 
+#                 previous sheet are used if the corners of a sheet are out of
+#                 the image, and guiding boxes of the previous sheet can be 
+#                 reused(if M.REUSE_PREVIOUS_GUIDING_BOXES is set).
+# Return        : CropState of the thread or None if CropStates is not passed.
+################################################################################
+def GetCropState(CropStates):
+    if CropStates is None:
+        return None
+
+    if not hasattr(CropStates, "State"):
+        CropStates.State = CropState()
+    return CropStates.State
+
+
+################################################################################
+# Function      : FindAnswers
+# Parameter     : InputImage - Resized input image of OMR sheet(or its InputPlanes).
+#                 Layout - Compiled layout of the OMR(from LoadLayout).
+#                 UpperLimitOfValue - Upper limit of "Value" for masking if
+#                                     calibrated for the batch else None.
+#                 CropStates - Per thread CropState of the batch(see GetCropState).
+#                 AnswerDict - It is the answer dictionary for the questions.
+# Description   : This function crops the OMR sheet and finds the answers to 
+#                 all the questions. If M.SPARSE_ANSWER_SAMPLING is set, the 
+#                 sheet is not cropped completely, only the region of each 
+#                 question is sampled from the input image.
+# Return        : AnswerDict
+################################################################################
+def FindAnswers(InputImage, Layout, UpperLimitOfValue=None, CropStates=None):
+    AnswerDict = {}
+
+    # Guiding boxes are found in "Value" plane and rest is done in gray plane if split.
+    ValueImage = None
+    if isinstance(InputImage, InputPlanes):
+        ValueImage = InputImage.ValueImage
+        InputImage = InputImage.GrayImage
+
+    if M.SPARSE_ANSWER_SAMPLING == 1:
+        # Only the regions of questions are sampled from input image.
+        ProjectiveMatrix = FindCropMatrix(InputImage, ExpandSideBy=Layout.ExpandSideBy, 
+                                          UpperLimitOfValue=UpperLimitOfValue, 
+                                          State=GetCropState(CropStates), ValueImage=ValueImage)
+        if len(InputImage.shape) == 3:
+            GrayImage = cv2.cvtColor(InputImage, cv2.COLOR_BGR2GRAY)
+        else:
+            GrayImage = InputImage
     else:
-        f = open(AnswersFilePath, 'a')
-    
-    f.write("\nAnswers to: {} :- \n".format(ImageName))
-    for Question, Answer in AnswerDict.items():
-        f.write("{}\t\t\t: {}\n".format(Question, Answer))
+        # Crop OMR wrt bounding boxes   
+        CroppedOMR, _ = CropOMR(InputImage, ExpandSideBy=list(Layout.ExpandSideBy), 
+                                UpperLimitOfValue=UpperLimitOfValue, State=GetCropState(CropStates),
+                                GrayOnly=(M.CROP_GRAY_ONLY == 1), ValueImage=ValueImage)
+        Sheet = GA.PreparedSheet(CroppedOMR)
+
+    # Extract different answers    
+    for i in range(Layout.NumOfQuestion):
+        QuestionParam = Layout.QuestionParam[i]
+        if M.SPARSE_ANSWER_SAMPLING == 1:
+            Sheet = GA.SampleQuestionRegion(GrayImage, ProjectiveMatrix, Layout.GridBoxes[i])
+        Q = GA.FindAnswer(QuestionParam[1], QuestionParam[2], QuestionParam[3],\
+                          QuestionParam[4], QuestionParam[5], QuestionParam[6],\
+                          QuestionParam[7], QuestionParam[8], QuestionParam[9], Layout.GridBoxes[i])
+        AnswerDict[QuestionParam[0]] = Q.FindAnswer(Sheet)
+
+    return AnswerDict
+
+
+################################################################################
+# Function      : OpenResultCache
+# Parameter     : Layout - Compiled layout of the OMR(from LoadLayout).
+# Description   : This function opens the cache of answers if M.RESULT_CACHE is
+#                 set. Answers stored in it are used only with the same layout
+#                 and macros. Cache is not used if guiding boxes of previous
+#                 sheet are reused, as the answers of a sheet then depend on
+#                 the previous sheet(and a sheet taken from the cache would not
+#                 update the CropState for the next sheet).
+# Return        : ResultCache or None
+################################################################################
+def OpenResultCache(Layout):
+    if M.RESULT_CACHE != 1 or M.REUSE_PREVIOUS_GUIDING_BOXES == 1:
+        return None
+
+    return ResultCache(os.path.abspath(M.RESULT_CACHE_FOLDER), M.RESULT_CACHE_MAX_SIZE, 
+                       Layout.SourceHash + "|" + HashMacros(M))
+
+
+################################################################################
+# Function      : ReadSheet
+# Parameter     : ImagePath - Path of the input image of OMR sheet.
+#                 Cache - ResultCache of the batch or None.
+#                 UpperLimitOfValue - Upper limit of "Value" for masking if
+#                                     calibrated for the batch else None.
+#                 Key - Key of the sheet in the cache.
+# Description   : This function reads the input image of the sheet. If the 
+#                 answers of the same image are in the cache, the image is
+#                 only hashed and not decoded.
+# Return        : (Key, AnswerDict from cache or None, InputImage or None)
+################################################################################
+def ReadSheet(ImagePath, Cache=None, UpperLimitOfValue=None):
+    if Cache is None:
+        return None, None, ReadInputImage(ImagePath)
+
+    with open(ImagePath, "rb") as File:
+        ImageBytes = File.read()
+    Key = Cache.MakeKey(ImageBytes, UpperLimitOfValue)
+
+    AnswerDict = Cache.Get(Key)
+    if AnswerDict is not None:
+        return Key, AnswerDict, None
+
+    return Key, None, ReadInputImage(ImagePath, ImageBytes)
+
+
+################################################################################
+# Function      : FindAnswersOfSheet
+# Parameter     : Sheet - Sheet read by ReadSheet.
+#                 {Rest parameters are same as that of FindAnswers}
+# Description   : This function finds the answers of the sheet(if not found in
+#                 the cache) and stores them in the cache.
+# Return        : AnswerDict
+################################################################################
+def FindAnswersOfSheet(Sheet, Layout, UpperLimitOfValue=None, CropStates=None, Cache=None):
+    Key, AnswerDict, InputImage = Sheet
+    if AnswerDict is None:
+        AnswerDict = FindAnswers(InputImage, Layout, UpperLimitOfValue, CropStates)
+        if Cache is not None:
+            Cache.Put(Key, AnswerDict)
+
+    return AnswerDict
+
+
+################################################################################
+# Function      : ReadOMRSheet
+# Parameter     : ImagePath - Path of the input image of OMR sheet.
+#                 Cache - ResultCache of the batch or None.
+#                 {Rest parameters are same as that of FindAnswers}
+# Description   : This function reads one OMR sheet and finds its answers.
+# Return        : AnswerDict
+################################################################################
+def ReadOMRSheet(ImagePath, Layout, UpperLimitOfValue=None, CropStates=None, Cache=None):
+    # Read Input and resize it
+    Sheet = ReadSheet(ImagePath, Cache, UpperLimitOfValue)
+
+    return FindAnswersOfSheet(Sheet, Layout, UpperLimitOfValue, CropStates, Cache)
+
+
+################################################################################
+# Function      : InitialiseWorker
+# Parameter     : OMR_Name - It is the name of omr type.
+#                 UpperLimitOfValue - Upper limit of "Value" for masking if
+#                                     calibrated for the batch else None.
+# Description   : This function runs once in every worker process of the batch.
+#                 It loads the compiled layout(and opens the cache) for the 
+#                 worker and limits the number of threads OpenCV uses so that
+#                 workers do not fight for the cores.
+# Return        : -
+################################################################################
+def InitialiseWorker(OMR_Name, UpperLimitOfValue):
+    global WorkerLayout, WorkerUpperLimitOfValue, WorkerCropStates, WorkerCache
+
+    cv2.setNumThreads(M.OPENCV_THREADS_PER_WORKER)
+    WorkerLayout = LoadLayout(OMR_Name)
+    WorkerUpperLimitOfValue = UpperLimitOfValue
+    WorkerCropStates = threading.local()
+    WorkerCache = OpenResultCache(WorkerLayout)
+
+
+def ReadOMRSheetInWorker(ImagePath):
+    return ReadOMRSheet(ImagePath, WorkerLayout, WorkerUpperLimitOfValue, WorkerCropStates, WorkerCache)
+
+
+################################################################################
+# Function      : OpenResultsWriter
+# Parameter     : OMR_Name - It is the name of omr type.
+#                 CreateNewFile - Flag for making a new answers file(else the
+#                                 answers are appended to the file).
+#                 InputImageFolderPath - Folder of the images of the batch.
+# Description   : This function opens the writer of answers file of the batch
+#                 in "Answers" folder in format M.RESULTS_FORMAT. If 
+#                 M.RESUME_BATCHES is set, the batch of the OMR which died 
+#                 halfway(on the same input folder) is continued.
+# Return        : ResultsWriter
+################################################################################
+def OpenResultsWriter(OMR_Name, CreateNewFile, InputImageFolderPath=None):
+    AnswersFolderPath = os.path.abspath(os.path.join('Answers'))
+    os.makedirs(AnswersFolderPath, exist_ok=True)
+
+    AnswersFilePath = AnswersFolderPath + "/" + OMR_Name + "_Answers" + Extensions[M.RESULTS_FORMAT]
+
+    return ResultsWriter(AnswersFilePath, M.RESULTS_FORMAT, Append=(not CreateNewFile), 
+                         FlushEvery=M.RESULTS_FLUSH_EVERY, Resume=(M.RESUME_BATCHES == 1), 
+                         InputFolderPath=InputImageFolderPath)
+
+
+################################################################################
+# Function      : RunStreamingPipeline
+# Parameter     : Writer - ResultsWriter of the answers file of the batch.
+#                 Layout - Compiled layout of the OMR(from LoadLayout).
+#                 UpperLimitOfValue - Upper limit of "Value" for masking if
+#                                     calibrated for the batch else None.
+#                 NumOfWorkers - Number of threads finding the answers.
+#                 {Rest parameters are same as that of main}
+# Description   : This function reads the sheets of the folder with the 
+#                 streaming pipeline. Folder is listed lazily, images are 
+#                 decoded by M.NUM_OF_DECODERS threads, answers are found by
+#                 NumOfWorkers threads and stored in order by this thread, all
+#                 at the same time. Stages are connected by queues of size
+#                 M.PIPELINE_QUEUE_SIZE so memory remains flat.
+# Return        : -
+################################################################################
+def RunStreamingPipeline(InputImageFolderPath, Writer, Layout, UpperLimitOfValue, NumOfWorkers):
+    CropStates = threading.local()
+    Cache = OpenResultCache(Layout)
+
+    def Decode(ImageName):
+        return ReadSheet(InputImageFolderPath + "/" + ImageName, Cache, UpperLimitOfValue)
+
+    def Compute(ImageName, Sheet):
+        return FindAnswersOfSheet(Sheet, Layout, UpperLimitOfValue, CropStates, Cache)
+
+    def Write(ImageName, AnswerDict):
+        Writer.Write(ImageName, AnswerDict, InputImageFolderPath + "/" + ImageName)
+
+    # Sheets finished before the batch was continued are skipped.
+    ImageNames = (ImageName for ImageName in ScanFolder(InputImageFolderPath) 
+                  if not Writer.IsFinished(InputImageFolderPath + "/" + ImageName))
+
+    PrevNumOfThreads = cv2.getNumThreads()
+    cv2.setNumThreads(M.OPENCV_THREADS_PER_WORKER)
+    try:
+        RunPipeline(ImageNames, Decode, Compute, Write, M.NUM_OF_DECODERS, NumOfWorkers, 
+                    M.PIPELINE_QUEUE_SIZE)
+    finally:
+        cv2.setNumThreads(PrevNumOfThreads)
 
 
 ################################################################################
@@ -49,36 +406,77 @@ def StoreInJSON(AnswerDict, OMR_Name, ImageName, CreateNewFile, FirstFile):
 #                 QuestionParam - List of parameters of the question of an OMR 
 #                                 with which we can operate and extract answers 
 #                                 for that question from the OMR.
+#                 NumOfWorkers - Number of worker processes reading the sheets
+#                                (M.NUM_OF_WORKERS by default).
+#                 ChunkSize - Number of sheets sent to a worker at once
+#                             (M.CHUNK_SIZE by default).
 # Description   : This function calls suitable functions one by one for reading  
 #                 the config file, cropping the OMR, and the rearranging/resizing 
 #                 the OMR sheet and then the answers are found for each question.
+#                 If more than one worker is asked, the sheets are read by a 
+#                 pool of threads or processes(M.THREAD_OR_PROCESS_WORKERS) and
+#                 answers are stored in the same order. If M.STREAMING_PIPELINE
+#                 is set, the sheets are read by RunStreamingPipeline instead.
 # Return        : -
 ################################################################################
-def main(OMR_Name, InputImageFolderPath, CreateNewFile=False):
-    AnswerDict = {}
-    FirstFile = True
+def main(OMR_Name, InputImageFolderPath, CreateNewFile=False, NumOfWorkers=None, ChunkSize=None):
+    if NumOfWorkers is None:
+        NumOfWorkers = M.NUM_OF_WORKERS
+    if ChunkSize is None:
+        ChunkSize = M.CHUNK_SIZE
 
-    for ImageName in os.listdir(InputImageFolderPath):
-        # Read Input and resize it
-        InputImage = cv2.imread(InputImageFolderPath + "/" + ImageName)
-        InputImage = cv2.resize(InputImage, M.RESIZE_TO)
-    
-        # Reading Config file
-        ExpandSideBy, NumOfQuestion, QuestionParam = ReadConfig(OMR_Name)
+    # Reading Config file(compiled only once for all the images).
+    Layout = LoadLayout(OMR_Name)
 
-        # Crop OMR wrt bounding boxes   
-        CroppedOMR, _ = CropOMR(InputImage, ExpandSideBy=ExpandSideBy)
-    
-        # Extract different answers    
-        for i in range(NumOfQuestion):
-            Q = GA.FindAnswer(QuestionParam[i][1], QuestionParam[i][2], QuestionParam[i][3],\
-                              QuestionParam[i][4], QuestionParam[i][5], QuestionParam[i][6],\
-                              QuestionParam[i][7], QuestionParam[i][8], QuestionParam[i][9])
-            AnswerDict[QuestionParam[i][0]] = Q.FindAnswer(CroppedOMR)
-
-        #print(AnswerDict)
-
-        StoreInJSON(AnswerDict, OMR_Name, ImageName, CreateNewFile, FirstFile)
-        FirstFile = False
+    # Checking brightness once for the complete batch if asked.
+    UpperLimitOfValue = None
+    if M.BRIGHTNESS_PER_BATCH:
+        FirstImageNames = list(islice(ScanFolder(InputImageFolderPath), M.BRIGHTNESS_CALIBRATION_SHEETS))
+        if len(FirstImageNames) > 0:
+            UpperLimitOfValue = CalibrateBrightnessForBatch(InputImageFolderPath, FirstImageNames)
+
+    if M.STREAMING_PIPELINE:
+        with OpenResultsWriter(OMR_Name, CreateNewFile, InputImageFolderPath) as Writer:
+            RunStreamingPipeline(InputImageFolderPath, Writer, Layout, UpperLimitOfValue, NumOfWorkers)
+        return
+
+    with OpenResultsWriter(OMR_Name, CreateNewFile, InputImageFolderPath) as Writer:
+        CropStates = threading.local()
+        Cache = OpenResultCache(Layout)
+        # Sheets finished before the batch was continued are skipped.
+        ImageNames = [ImageName for ImageName in os.listdir(InputImageFolderPath) 
+                      if not Writer.IsFinished(InputImageFolderPath + "/" + ImageName)]
+        ImagePaths = [InputImageFolderPath + "/" + ImageName for ImageName in ImageNames]
+
+        if NumOfWorkers > 1 and M.THREAD_OR_PROCESS_WORKERS == 0:
+            # Reading sheets in parallel threads(detection and cropping keep no module 
+            # globals and OpenCV releases the GIL). Answers are returned in order.
+            PrevNumOfThreads = cv2.getNumThreads()
+            cv2.setNumThreads(M.OPENCV_THREADS_PER_WORKER)
+            Executor = concurrent.futures.ThreadPoolExecutor(NumOfWorkers)
+            AnswerDicts = Executor.map(ReadOMRSheet, ImagePaths, repeat(Layout), repeat(UpperLimitOfValue), 
+                                       repeat(CropStates), repeat(Cache))
+        elif NumOfWorkers > 1:
+            # Reading sheets in parallel processes. imap returns the answers in the same 
+            # order as the images so the output is same as that of reading one by one.
+            Pool = multiprocessing.Pool(NumOfWorkers, initializer=InitialiseWorker, 
+                                        initargs=(OMR_Name, UpperLimitOfValue))
+            AnswerDicts = Pool.imap(ReadOMRSheetInWorker, ImagePaths, chunksize=ChunkSize)
+        else:
+            AnswerDicts = (ReadOMRSheet(ImagePath, Layout, UpperLimitOfValue, CropStates, Cache) 
+                           for ImagePath in ImagePaths)
+
+        try:
+            for ImageName, ImagePath, AnswerDict in zip(ImageNames, ImagePaths, AnswerDicts):
+                #print(AnswerDict)
+
+                Writer.Write(ImageName, AnswerDict, ImagePath)
+        finally:
+            if NumOfWorkers > 1 and M.THREAD_OR_PROCESS_WORKERS == 0:
+                Executor.shutdown(cancel_futures=True)
+                cv2.setNumThreads(PrevNumOfThreads)
+            elif NumOfWorkers > 1:
+                Pool.terminate()
+                Pool.join()
 
     #cv2.waitKey(0)
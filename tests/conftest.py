@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+
+SourceFolderPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SourceFolderPath)
+
+
+# Code reads config files, templates and input images relative to src folder.
+@pytest.fixture
+def InSourceFolder(monkeypatch):
+    monkeypatch.chdir(SourceFolderPath)
+    return SourceFolderPath
@@ -0,0 +1,336 @@
+import cv2
+import numpy as np
+import pytest
+
+import macros as M
+import FindBoundingBoxes as FBB
+from FindBoundingBoxes import FindGuidingCornerBoxes
+
+
+# White sheet with a column of guiding boxes near each side, LeftX from the sides.
+def MakeSheet(LeftX, Width=750, Height=950, NumOfBoxes=20):
+    Image = np.full((Height, Width, 3), 255, np.uint8)
+    for i in range(NumOfBoxes):
+        y = 60 + 42*i
+        cv2.rectangle(Image, (LeftX, y), (LeftX + 15, y + 7), (0, 0, 0), -1)
+        cv2.rectangle(Image, (Width - LeftX - 16, y), (Width - LeftX - 1, y + 7), (0, 0, 0), -1)
+
+    return Image
+
+
+def test_MissingCornerBoxRaisesValueError():
+    # Too few boxes in the column for them to be corner boxes.
+    Boxes = [[10, 20 + 30*i, 25, 25 + 30*i] for i in range(3)]
+
+    with pytest.raises(ValueError, match="TL, TR, BR, BL"):
+        FindGuidingCornerBoxes(Boxes, (950, 750))
+
+
+@pytest.mark.parametrize("LeftX", [40, 136, 140, 146])
+def test_MarginStripsFindSameBoxesAsCompleteImage(monkeypatch, LeftX):
+    monkeypatch.setattr(M, "MARGIN_STRIP_WIDTH_RATIO", 0.2)
+    Image = MakeSheet(LeftX)
+
+    monkeypatch.setattr(M, "DETECT_IN_MARGIN_STRIPS", 0)
+    Expected = FBB.FindBoundingBoxes(Image, 100)
+    monkeypatch.setattr(M, "DETECT_IN_MARGIN_STRIPS", 1)
+    assert FBB.FindBoundingBoxes(Image, 100) == Expected
+    assert len(Expected[0]) == len(Expected[1]) == 20
+
+
+def test_BoxCutByMarginStripIsNotAccepted(monkeypatch):
+    monkeypatch.setattr(M, "MARGIN_STRIP_WIDTH_RATIO", 0.2)
+
+    # Guiding boxes at x = 140 to 155 cross the inner edge(x = 150) of the strips.
+    Context = FBB.DetectionContext(MakeSheet(140), 100)
+    assert FBB.FindBoxesInMarginStrips(Context) == (None, None)
+
+    Context = FBB.DetectionContext(MakeSheet(40), 100)
+    MaskedImage, BoxCoordinates = FBB.FindBoxesInMarginStrips(Context)
+    assert len(BoxCoordinates) == 40
+
+
+def test_ConnectedComponentsLogicFindsSameBoxesAsContourLogic():
+    MaskedImage = np.zeros((200, 300), np.uint8)
+    # Guiding boxes of usual size, ones touching the image boundary and ones near the max area
+    # (area of box with the margin is above M.MAX_CONTOUR_AREA).
+    Rects = [(20, 20, 16, 8), (60, 20, 5, 3), (100, 20, 24, 19), (150, 20, 27, 18),
+             (0, 60, 16, 8), (284, 60, 16, 8), (282, 100, 16, 8), (150, 192, 16, 8),
+             (0, 0, 12, 6), (200, 150, 30, 16), (20, 150, 40, 10)]
+    for x, y, w, h in Rects:
+        MaskedImage[y:(y+h), x:(x+w)] = 255
+
+    Expected = FBB.FindGuidingBoxes_ContourLogic(MaskedImage)
+    assert sorted(FBB.FindGuidingBoxes_ConnectedComponentsLogic(MaskedImage)) == sorted(Expected)
+    # Box whose area with the margin is exactly at the max limit is kept by contour logic.
+    assert [99, 19, 124, 39] in Expected
+
+
+def test_ConnectedComponentsLogicFindsSameBoxesAsContourLogicOnRandomSheets():
+    Random = np.random.default_rng(0)
+    for i in range(50):
+        MaskedImage = np.zeros((200, 300), np.uint8)
+        # One patch in each cell so that patches are never joined.
+        for CellY in range(0, 200, 40):
+            for CellX in range(0, 300, 60):
+                w = int(Random.integers(4, 40))
+                h = int(Random.integers(3, min(w, 36)))
+                x = CellX + int(Random.integers(0, 60 - w - 2))
+                y = CellY + int(Random.integers(0, 40 - h - 2))
+                MaskedImage[y:(y+h), x:(x+w)] = 255
+
+        assert (sorted(FBB.FindGuidingBoxes_ConnectedComponentsLogic(MaskedImage)) ==
+                sorted(FBB.FindGuidingBoxes_ContourLogic(MaskedImage)))
+
+
+# Random masked image(white patches on black) and boxes lying in it.
+def MakeRandomMask(Random, Height=60, Width=80):
+    MaskedImage = np.uint8(Random.random((Height, Width)) < Random.random()*0.3) * 255
+    for i in range(int(Random.integers(0, 6))):
+        x, y = int(Random.integers(0, Width - 4)), int(Random.integers(0, Height - 4))
+        MaskedImage[y:(y + int(Random.integers(2, 20))), x:(x + int(Random.integers(2, 30)))] = 255
+
+    return MaskedImage
+
+
+def MakeRandomBoxes(Random, Height, Width, NumOfBoxes):
+    Boxes = []
+    for i in range(NumOfBoxes):
+        x1, y1 = int(Random.integers(0, Width)), int(Random.integers(0, Height))
+        Boxes.append([x1, y1, int(Random.integers(x1, Width)), int(Random.integers(y1, Height))])
+
+    return Boxes
+
+
+def CheckBoundaryForAllBlack_Old(x1, y1, x2, y2, MaskedImage):
+    FoundWhite = False
+    BoundaryWithWhite = [0, 0, 0, 0]
+
+    for i in range(x1, (x2+1)):
+        if MaskedImage[y1][i] != 0:
+            FoundWhite = True
+            BoundaryWithWhite[0] = 1
+        if MaskedImage[y2][i] != 0:
+            FoundWhite = True
+            BoundaryWithWhite[2] = 1
+
+    for j in range(y1, (y2+1)):
+        if MaskedImage[j][x1] != 0:
+            FoundWhite = True
+            BoundaryWithWhite[3] = 1
+        if MaskedImage[j][x2] != 0:
+            FoundWhite = True
+            BoundaryWithWhite[1] = 1
+
+    return (not FoundWhite), BoundaryWithWhite
+
+
+def ShrinkBoxWRTBoundary_Old(BoxCoordinates, MaskedImage):
+    ShrinkedBoxCoordinates = []
+    for Box in BoxCoordinates:
+        x1, y1, x2, y2 = Box[0], Box[1], Box[2], Box[3]
+        FinalBox = Box
+
+        while x1 <= x2 and y1 <= y2:
+            Flag, BoundaryWithWhite = CheckBoundaryForAllBlack_Old(x1, y1, x2, y2, MaskedImage)
+            if Flag:
+                if MaskedImage[int((y2+y1)/2)][int((x1+x2)/2)] != 0:
+                    FinalBox = [x1, y1, x2, y2]
+            x1 += 1
+            y1 += 1
+            x2 -= 1
+            y2 -= 1
+
+        ShrinkedBoxCoordinates.append(FinalBox)
+
+    return ShrinkedBoxCoordinates
+
+
+def test_CheckBoundaryForAllBlackIsSameAsLoop():
+    Random = np.random.default_rng(9)
+    for i in range(100):
+        MaskedImage = MakeRandomMask(Random)
+        IntegralImage = FBB.MakeIntegralImage(MaskedImage)
+        for Box in MakeRandomBoxes(Random, *MaskedImage.shape, 20):
+            Expected = CheckBoundaryForAllBlack_Old(*Box, MaskedImage)
+            assert FBB.CheckBoundaryForAllBlack(*Box, MaskedImage) == Expected
+            assert FBB.CheckBoundaryForAllBlack(*Box, MaskedImage, IntegralImage) == Expected
+
+
+def test_ShrinkBoxWRTBoundaryIsSameAsLoop():
+    Random = np.random.default_rng(9)
+    for i in range(40):
+        MaskedImage = MakeRandomMask(Random)
+        Boxes = MakeRandomBoxes(Random, *MaskedImage.shape, 20)
+        # Boxes around white patches so that they are shrinked.
+        NumOfLabels, Labels, Stats, Centroids = cv2.connectedComponentsWithStats(np.uint8(MaskedImage != 0))
+        for x, y, w, h, Area in Stats[1:].tolist():
+            Margin = int(Random.integers(0, 4))
+            Boxes.append([max(x - Margin, 0), max(y - Margin, 0), min(x + w - 1 + Margin, 79), 
+                          min(y + h - 1 + Margin, 59)])
+
+        assert FBB.ShrinkBoxWRTBoundary(Boxes, MaskedImage) == ShrinkBoxWRTBoundary_Old(Boxes, MaskedImage)
+
+
+def ShrinkTotalBox_Old(BoxCoordinates, MaskedImage):
+    FinalBoxCoordinates = []
+    for Box in BoxCoordinates:
+        XCoordinates = []
+        YCoordinates = []
+        x1, y1, x2, y2 = Box[0], Box[1], Box[2], Box[3]
+        for i in range(x1, (x2+1)):
+            for j in range(y1, (y2+1)):
+                if MaskedImage[j][i] != 0:
+                    XCoordinates.append(i)
+                    YCoordinates.append(j)
+
+        XCoordinates = sorted(XCoordinates)
+        YCoordinates = sorted(YCoordinates)
+        FinalBoxCoordinates.append([XCoordinates[0], YCoordinates[0], XCoordinates[-1], YCoordinates[-1]])
+
+    return FinalBoxCoordinates
+
+
+def test_ShrinkTotalBoxIsSameAsLoop():
+    Random = np.random.default_rng(10)
+    for i in range(100):
+        MaskedImage = MakeRandomMask(Random)
+        # Loop fails for boxes without any white pixel, they are kept as it is now.
+        Boxes = [Box for Box in MakeRandomBoxes(Random, *MaskedImage.shape, 10)
+                 if MaskedImage[Box[1]:(Box[3]+1), Box[0]:(Box[2]+1)].any()]
+
+        assert FBB.ShrinkTotalBox(Boxes, MaskedImage) == ShrinkTotalBox_Old(Boxes, MaskedImage)
+
+    assert FBB.ShrinkTotalBox([[5, 5, 10, 10]], np.zeros((20, 20), np.uint8)) == [[5, 5, 10, 10]]
+
+
+def FilterBoxCoordinates_Old(BoxCoordinates):
+    FinalBoxCoordinates = []
+    LengthOfBoxCoordinates = len(BoxCoordinates)
+    for I in range(LengthOfBoxCoordinates):
+        FoundIntersectingArea = 0
+        for J in range(I + 1, LengthOfBoxCoordinates):
+            if FBB.IntersectingArea(BoxCoordinates[I], BoxCoordinates[J]) is True:
+                FoundIntersectingArea = 1
+                break
+        if FoundIntersectingArea == 0:
+            FinalBoxCoordinates.append(BoxCoordinates[I])
+
+    return FinalBoxCoordinates
+
+
+def test_FilterBoxCoordinatesIsSameAsLoop():
+    Random = np.random.default_rng(11)
+    for i in range(200):
+        # Mostly small boxes(as guiding boxes) with some large ones spanning many cells.
+        Boxes = []
+        for j in range(int(Random.integers(0, 60))):
+            x1, y1 = int(Random.integers(0, 300)), int(Random.integers(0, 300))
+            MaxSize = 120 if Random.random() < 0.1 else 20
+            Boxes.append([x1, y1, x1 + int(Random.integers(0, MaxSize)), y1 + int(Random.integers(0, MaxSize))])
+        # Same box found more than once.
+        Boxes += [list(Box) for Box in Boxes[:int(Random.integers(0, 3))]]
+
+        assert FBB.FilterBoxCoordinates(Boxes) == FilterBoxCoordinates_Old(Boxes)
+
+
+def FilterGuidingBoxes_RansacLogic_Old(BoxesList):
+    CenterOfBoxesList = FBB.CenterOfBoxes(BoxesList)
+    CenterInliersList = []
+    LengthOfBoxesList = len(CenterOfBoxesList)
+    for i in range(LengthOfBoxesList):
+        for j in range((i+1), LengthOfBoxesList):
+            InliersList = [i, j]
+            InlierCount = 0
+            if (CenterOfBoxesList[j][1] - CenterOfBoxesList[i][1]) == 0:
+                B = 100000
+            else:
+                B = ((CenterOfBoxesList[j][0] - CenterOfBoxesList[i][0]) /
+                     (CenterOfBoxesList[j][1] - CenterOfBoxesList[i][1]))
+            A = (CenterOfBoxesList[i][0] - (CenterOfBoxesList[i][1] * B))
+            for k in range(LengthOfBoxesList):
+                X = (A + (CenterOfBoxesList[k][1] * B))
+                if (-(M.MAX_INLIER_DIST)) <= (X - CenterOfBoxesList[k][0]) <= M.MAX_INLIER_DIST:
+                    InliersList.append(k)
+                    InlierCount += 1
+            InliersList.append(InlierCount)
+            CenterInliersList.append(InliersList)
+
+    MaxInlierList = [0]
+    for InlierList in CenterInliersList:
+        if InlierList[-1] >= MaxInlierList[-1]:
+            MaxInlierList = InlierList
+
+    return [BoxesList[MaxInlierList[i]] for i in range(2, (len(MaxInlierList) - 1))]
+
+
+def FilterGuidingBoxes_ScoreLogic_Old(BoxesList):
+    Scores = []
+    for BoxToBeScored in BoxesList:
+        Score = 0
+        for Box in BoxesList:
+            if Box[2] > BoxToBeScored[0] and Box[0] < BoxToBeScored[2]:
+                Score += 1
+        Scores.append(Score)
+
+    return [BoxesList[i] for i in range(len(Scores)) if Scores[i] >= M.MIN_SCORE_REQ]
+
+
+# Column of guiding boxes(slightly tilted) mixed with random boxes.
+def MakeRandomGuidingBoxes(Random):
+    Boxes = []
+    x, Tilt = int(Random.integers(10, 100)), Random.uniform(-0.05, 0.05)
+    for i in range(int(Random.integers(0, 25))):
+        y = 20 + 30*i + int(Random.integers(-2, 3))
+        x1 = x + int(Tilt*y) + int(Random.integers(-2, 3))
+        Boxes.append([x1, y, x1 + int(Random.integers(12, 18)), y + int(Random.integers(6, 10))])
+    for i in range(int(Random.integers(0, 10))):
+        x1, y1 = int(Random.integers(0, 200)), int(Random.integers(0, 800))
+        Boxes.insert(int(Random.integers(0, len(Boxes) + 1)), 
+                     [x1, y1, x1 + int(Random.integers(2, 40)), y1 + int(Random.integers(2, 20))])
+
+    return Boxes
+
+
+def test_FilterGuidingBoxesIsSameAsLoop():
+    Random = np.random.default_rng(13)
+    for i in range(150):
+        Boxes = MakeRandomGuidingBoxes(Random)
+
+        assert FBB.FilterGuidingBoxes_RansacLogic(Boxes) == FilterGuidingBoxes_RansacLogic_Old(Boxes)
+        assert FBB.FilterGuidingBoxes_ScoreLogic(Boxes) == FilterGuidingBoxes_ScoreLogic_Old(Boxes)
+
+
+def RANSAC_OnArea_Old(BoxesList, LengthReq, ImageArea):
+    AreaOfBoxesList = [(Box[0] - Box[2])*(Box[1] - Box[3]) for Box in BoxesList]
+    DifferenceInArea = 0
+    while DifferenceInArea <= ImageArea:
+        TotalInliersList = []
+        for i in range(len(AreaOfBoxesList)):
+            InlierList = [j for j in range(len(AreaOfBoxesList)) 
+                          if (-(DifferenceInArea)) <= (AreaOfBoxesList[i] - AreaOfBoxesList[j]) <= DifferenceInArea]
+            InlierList.append(len(InlierList))
+            TotalInliersList.append(InlierList)
+
+        for InlierList in TotalInliersList:
+            if InlierList[-1] == LengthReq:
+                print("Found all inliers wrt area.")
+                return [BoxesList[InlierList[i]] for i in range(len(InlierList)-1)]
+        DifferenceInArea += 1
+
+    print("Cannot find inliers wrt area.")
+    return BoxesList
+
+
+def test_RANSAC_OnAreaIsSameAsLoop(capsys):
+    Random = np.random.default_rng(14)
+    for i in range(150):
+        Boxes = MakeRandomGuidingBoxes(Random)
+        # Required length may be more than the boxes or not found within ImageArea.
+        LengthReq = int(Random.integers(0, len(Boxes) + 2))
+        ImageArea = int(Random.integers(0, 300))
+
+        Result = FBB.RANSAC_OnArea(Boxes, LengthReq, ImageArea)
+        Printed = capsys.readouterr().out
+        assert Result == RANSAC_OnArea_Old(Boxes, LengthReq, ImageArea)
+        assert Printed == capsys.readouterr().out
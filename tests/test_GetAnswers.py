@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+import macros as M
+from GetAnswers import FindAnswer, PreparedSheet
+
+
+# FindAnswer as it was before counting from integral image(grid made by stepping decimal
+# grid size and black pixels counted in each grid box separately).
+def FindAnswer_Old(OMRImage, C_X, C_Y, Width, Length, NumOfRows, NumOfCols, By_CorR, Alp_or_Num, StartFromIndex):
+    Image = OMRImage[C_Y:C_Y + Length, C_X:C_X + Width]
+    ThreshImage = cv2.cvtColor(Image, cv2.COLOR_BGR2GRAY)
+    ret, ThreshImage = cv2.threshold(ThreshImage, M.ThresholdImageAt, 255, cv2.THRESH_BINARY)
+    HistogramMatrix = np.zeros((NumOfRows, NumOfCols), dtype=int)
+
+    Height, Width = Image.shape[:2]
+    GridWidth = Width/NumOfCols
+    GridHeight = Height/NumOfRows
+    i = 0
+    HistMatrix_i = 0
+    while i < Height:
+        j = 0
+        HistMatrix_j = 0
+        while j < Width:
+            GridImage = ThreshImage[int(i):int(i) + int(GridHeight-1), int(j):int(j) + int(GridWidth-1)]
+            HistogramMatrix[HistMatrix_i, HistMatrix_j] = np.count_nonzero(GridImage != 255)
+            HistMatrix_j += 1
+            if HistMatrix_j >= NumOfCols:
+                break
+            j += GridWidth
+        HistMatrix_i += 1
+        if HistMatrix_i >= NumOfRows:
+            break
+        i += GridHeight
+
+    Histogram = HistogramMatrix.T if By_CorR == 'C' else HistogramMatrix
+    AnswerString = ""
+    for Row in Histogram:
+        IndexOfMax = -1
+        Max = 0
+        for j in range(len(Row)):
+            if Max < Row[j] and Row[j] >= M.MIN_NUM_OF_BLACK_FOR_ANSWER:
+                Max = Row[j]
+                IndexOfMax = j
+        if Alp_or_Num == 0:
+            AnswerString += M.Alphabet[IndexOfMax + StartFromIndex]
+        elif IndexOfMax == -1:
+            AnswerString += '_'
+        else:
+            AnswerString += str(IndexOfMax + StartFromIndex)
+
+    return HistogramMatrix, AnswerString
+
+
+def test_FindAnswerIsSameAsLoop():
+    Random = np.random.default_rng(2)
+    for i in range(100):
+        # Sheet with random marks(dark rectangles) and noise.
+        Image = np.uint8(Random.integers(60, 256, (120, 160, 3)))
+        for j in range(int(Random.integers(0, 15))):
+            x, y = int(Random.integers(0, 150)), int(Random.integers(0, 110))
+            Image[y:(y + int(Random.integers(2, 12))), x:(x + int(Random.integers(2, 12)))] = 0
+        Sheet = PreparedSheet(Image)
+
+        NumOfRows, NumOfCols = int(Random.integers(1, 12)), int(Random.integers(1, 12))
+        C_X, C_Y = int(Random.integers(0, 60)), int(Random.integers(0, 40))
+        Width = int(Random.integers(NumOfCols, 160 - C_X + 1))
+        Length = int(Random.integers(NumOfRows, 120 - C_Y + 1))
+        Question = (C_X, C_Y, Width, Length, NumOfRows, NumOfCols, ['C', 'R'][i % 2], (i // 2) % 2, 
+                    int(Random.integers(0, 3)))
+
+        HistogramMatrix, AnswerString = FindAnswer_Old(Image, *Question)
+        Answer = FindAnswer(*Question)
+        assert Answer.FindAnswer(Image) == AnswerString
+        assert np.array_equal(Answer.HistogramMatrix, HistogramMatrix)
+        # Sheet prepared once for all questions gives the same answer.
+        assert FindAnswer(*Question).FindAnswer(Sheet) == AnswerString
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from Pipeline import RunPipeline
+
+
+def test_ResultsAreWrittenInOrder():
+    Written = []
+    RunPipeline(range(50), lambda Item: Item, lambda Item, Decoded: Decoded * 2,
+                lambda Item, Result: Written.append((Item, Result)), NumOfDecoders=3, NumOfWorkers=4, QueueSize=2)
+
+    assert Written == [(Item, Item * 2) for Item in range(50)]
+
+
+def test_ErrorWhileListingItemsIsRaised():
+    def Items():
+        yield 1
+        yield 2
+        raise OSError("cannot list")
+
+    Written = []
+    Raised = []
+
+    def Run():
+        try:
+            RunPipeline(Items(), lambda Item: Item, lambda Item, Decoded: Decoded,
+                        lambda Item, Result: Written.append(Item), NumOfDecoders=2, NumOfWorkers=2)
+        except OSError as Error:
+            Raised.append(Error)
+
+    # Run in a thread so that a hang fails the test instead of blocking it.
+    Thread = threading.Thread(target=Run, daemon=True)
+    Thread.start()
+    Thread.join(30)
+
+    assert not Thread.is_alive()
+    assert len(Raised) == 1 and "cannot list" in str(Raised[0])
+    assert Written == [1, 2]
+
+
+def test_ErrorOfStageIsRaised():
+    def Compute(Item, Decoded):
+        if Item == 3:
+            raise ValueError("bad sheet")
+        return Decoded
+
+    with pytest.raises(ValueError, match="bad sheet"):
+        RunPipeline(range(10), lambda Item: Item, Compute, lambda Item, Result: None, NumOfWorkers=2)
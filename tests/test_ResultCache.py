@@ -0,0 +1,79 @@
+import os
+
+import main
+import macros as M
+import ResultCache as RC
+from ResultCache import ResultCache, HashMacros
+
+
+def test_MacroChangeMissesCache(InSourceFolder, tmp_path, monkeypatch):
+    monkeypatch.setattr(M, "RESULT_CACHE", 1)
+    monkeypatch.setattr(M, "RESULT_CACHE_FOLDER", str(tmp_path / "Cache"))
+    monkeypatch.setattr(M, "REUSE_PREVIOUS_GUIDING_BOXES", 0)
+    Layout = main.LoadLayout("OMR4")
+    ImagePath = os.path.join("InputImages", "OMR4", "Filled", "Filled1.jpg")
+
+    FindAnswers = main.FindAnswers
+    NumOfSheetsRead = [0]
+
+    def FindAnswersCounting(*Args, **KwArgs):
+        NumOfSheetsRead[0] += 1
+        return FindAnswers(*Args, **KwArgs)
+
+    monkeypatch.setattr(main, "FindAnswers", FindAnswersCounting)
+
+    AnswerDict = main.ReadOMRSheet(ImagePath, Layout, Cache=main.OpenResultCache(Layout))
+    assert main.ReadOMRSheet(ImagePath, Layout, Cache=main.OpenResultCache(Layout)) == AnswerDict
+    assert NumOfSheetsRead[0] == 1
+
+    # Macro changing the answers.
+    monkeypatch.setattr(M, "ThresholdImageAt", M.ThresholdImageAt + 5)
+    main.ReadOMRSheet(ImagePath, Layout, Cache=main.OpenResultCache(Layout))
+    assert NumOfSheetsRead[0] == 2
+
+    # Macro not changing the answers.
+    monkeypatch.setattr(M, "NUM_OF_WORKERS", M.NUM_OF_WORKERS + 1)
+    main.ReadOMRSheet(ImagePath, Layout, Cache=main.OpenResultCache(Layout))
+    assert NumOfSheetsRead[0] == 2
+
+
+def test_CacheNotUsedWhenReusingGuidingBoxes(monkeypatch):
+    monkeypatch.setattr(M, "RESULT_CACHE", 1)
+    monkeypatch.setattr(M, "REUSE_PREVIOUS_GUIDING_BOXES", 1)
+
+    assert main.OpenResultCache(None) is None
+
+
+def test_MacrosHashChangesWithMacros(monkeypatch):
+    Hash = HashMacros(M)
+    monkeypatch.setattr(M, "MIN_SCORE_REQ", M.MIN_SCORE_REQ + 1)
+
+    assert HashMacros(M) != Hash
+
+
+def FolderSize(FolderPath):
+    return sum(os.path.getsize(os.path.join(FolderPath, Name)) for Name in os.listdir(FolderPath))
+
+
+def test_SizeBoundedWithManyWorkers(tmp_path):
+    MaxSize = 20000
+    # Caches of different worker processes sharing the folder.
+    Caches = [ResultCache(str(tmp_path), MaxSize, "Context") for i in range(4)]
+    AnswerDict = {"A1_25": "ABCD" * 25}
+
+    for i in range(400):
+        Caches[i % len(Caches)].Put("Sheet{}".format(i), AnswerDict)
+        assert FolderSize(tmp_path) <= MaxSize * (1 + len(Caches) * RC.RecountAfter)
+
+
+def test_StaleTempFilesRemoved(tmp_path):
+    StaleTempPath = tmp_path / "Stale.tmp"
+    StaleTempPath.write_bytes(b"partial")
+    os.utime(StaleTempPath, (0, 0))
+    NewTempPath = tmp_path / "New.tmp"
+    NewTempPath.write_bytes(b"being written")
+
+    ResultCache(str(tmp_path), 1000, "Context")
+
+    assert not StaleTempPath.exists()
+    assert NewTempPath.exists()
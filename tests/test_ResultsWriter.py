@@ -0,0 +1,113 @@
+import os
+
+import main
+import macros as M
+
+
+# Runs main on a copy of the sample images of OMR4 with resuming on. Sheet number 
+# CrashAt(counted from 1) raises an error if given.
+def RunBatch(monkeypatch, InputImageFolderPath, CrashAt=None):
+    FindAnswers = main.FindAnswers
+    NumOfSheets = [0]
+
+    def FindAnswersCrashing(*Args, **KwArgs):
+        NumOfSheets[0] += 1
+        if NumOfSheets[0] == CrashAt:
+            raise RuntimeError("crash")
+        return FindAnswers(*Args, **KwArgs)
+
+    monkeypatch.setattr(main, "FindAnswers", FindAnswersCrashing)
+    main.main("OMR4", InputImageFolderPath, CreateNewFile=True)
+
+    return NumOfSheets[0]
+
+
+def test_ResumeAfterCrashHasNoDuplicates(InSourceFolder, tmp_path, monkeypatch):
+    monkeypatch.setattr(M, "RESUME_BATCHES", 1)
+    monkeypatch.setattr(M, "RESULTS_FLUSH_EVERY", 1)
+    monkeypatch.setattr(M, "NUM_OF_WORKERS", 1)
+    monkeypatch.setattr(M, "STREAMING_PIPELINE", 0)
+    monkeypatch.setattr(M, "RESULTS_FORMAT", "txt")
+    monkeypatch.setattr(M, "RESULT_CACHE", 0)
+    # Answers are written in tmp_path/Answers, layout is read from source folder.
+    monkeypatch.setattr(main, "OpenResultsWriter", 
+                        lambda OMR_Name, CreateNewFile, InputImageFolderPath=None: 
+                        main.ResultsWriter(str(tmp_path / "Answers.txt"), "txt", Append=(not CreateNewFile), 
+                                           Resume=True, InputFolderPath=InputImageFolderPath))
+
+    InputImageFolderPath = os.path.join("InputImages", "OMR4", "Filled")
+    NumOfImages = len(os.listdir(InputImageFolderPath))
+
+    try:
+        RunBatch(monkeypatch, InputImageFolderPath, CrashAt=3)
+    except RuntimeError:
+        pass
+    assert not os.path.exists(tmp_path / "Answers.txt")
+
+    # Same folder written differently.
+    NumOfSheets = RunBatch(monkeypatch, os.path.abspath(InputImageFolderPath) + "/")
+
+    Answers = open(tmp_path / "Answers.txt").read()
+    assert NumOfSheets == NumOfImages - 2
+    assert Answers.count("Answers to:") == NumOfImages
+    for ImageName in os.listdir(InputImageFolderPath):
+        assert Answers.count("Answers to: {} :-".format(ImageName)) == 1
+    assert sorted(os.listdir(tmp_path)) == ["Answers.txt"]
+
+
+def test_OtherInputFolderStartsAgain(tmp_path):
+    ImageFolderPaths = [tmp_path / "Batch1", tmp_path / "Batch2"]
+    for ImageFolderPath in ImageFolderPaths:
+        ImageFolderPath.mkdir()
+        (ImageFolderPath / "Sheet.jpg").write_bytes(b"image")
+
+    FilePath = str(tmp_path / "Answers.jsonl")
+    Writer = main.ResultsWriter(FilePath, "jsonl", Resume=True, InputFolderPath=str(ImageFolderPaths[0]))
+    Writer.Write("Sheet.jpg", {"Q1": "A"}, str(ImageFolderPaths[0] / "Sheet.jpg"))
+    Writer.Abort()
+
+    Writer = main.ResultsWriter(FilePath, "jsonl", Resume=True, InputFolderPath=str(ImageFolderPaths[1]))
+    assert not Writer.IsFinished(str(ImageFolderPaths[1] / "Sheet.jpg"))
+    Writer.Close()
+    assert open(FilePath).read() == ""
+
+
+# Text written by StoreInJSON before ResultsWriter replaced it.
+def StoreInJSON_Old(File, AnswerDict, ImageName):
+    File.write("\nAnswers to: {} :- \n".format(ImageName))
+    for Question, Answer in AnswerDict.items():
+        File.write("{}\t\t\t: {}\n".format(Question, Answer))
+
+
+def test_TextIsSameAsStoreInJSON(tmp_path):
+    Sheets = [("Filled1.jpg", {"RollNumber": "1015110", "A1_25": "ACDB_CAB"}), 
+              ("Filled2.jpg", {"RollNumber": "43475", "A1_25": "__B_CABD"})]
+
+    with open(tmp_path / "Old.txt", "w") as File:
+        for ImageName, AnswerDict in Sheets:
+            StoreInJSON_Old(File, AnswerDict, ImageName)
+
+    with main.ResultsWriter(str(tmp_path / "New.txt"), "txt", FlushEvery=1) as Writer:
+        Writer.Write(*Sheets[0])
+    # Appended in the next batch.
+    with main.ResultsWriter(str(tmp_path / "New.txt"), "txt", Append=True) as Writer:
+        Writer.Write(*Sheets[1])
+
+    assert (tmp_path / "New.txt").read_bytes() == (tmp_path / "Old.txt").read_bytes()
+    assert sorted(os.listdir(tmp_path)) == ["New.txt", "Old.txt"]
+
+
+def test_FailedBatchLeavesAnswersUnchanged(tmp_path):
+    FilePath = str(tmp_path / "Answers.csv")
+    with main.ResultsWriter(FilePath, "csv") as Writer:
+        Writer.Write("Filled1.jpg", {"Q1": "A", "Q2": "B"})
+
+    try:
+        with main.ResultsWriter(FilePath, "csv", Append=True) as Writer:
+            Writer.Write("Filled2.jpg", {"Q1": "C", "Q2": "D"})
+            raise RuntimeError("crash")
+    except RuntimeError:
+        pass
+
+    assert open(FilePath).read().splitlines() == ["ImageName,Q1,Q2", "Filled1.jpg,A,B"]
+    assert sorted(os.listdir(tmp_path)) == ["Answers.csv"]